@@ -4,16 +4,7 @@ import numpy as np
 from pathlib import Path
 import vegas
 
-from simulator import squared_matrix_element, ZBoson, plotGrid, setFontSizes
-from simulator.constants import *
-
-
-def integrand(x):
-    s, cos_theta, phi = x
-    d_sigma = np.sum([squared_matrix_element(s, cos_theta, q) for q in range(N_q)])
-    d_sigma *= f_conv / (64 * (np.pi ** 2) * s * (s_max - s_min))
-
-    return d_sigma
+from simulator import CrossSectionIntegrand, Uniform, ZBoson, plotGrid, setFontSizes
 
 
 def main() -> None:
@@ -21,6 +12,9 @@ def main() -> None:
     cos_lims = [-1, 1]
     phi_lims = [0, 2 * np.pi]
 
+    # Batched integrand, including the flat beam spectrum 1/(s_max - s_min).
+    integrand = CrossSectionIntegrand(beam_distro=Uniform(s_min, s_max))
+
     gvar.ranseed(seed=42)  # Set the seed of the vegas' integrator.
     integrator = vegas.Integrator([s_lims, cos_lims, phi_lims])
     sigma_eval = integrator(integrand, nitn=10, neval=1000)
@@ -10,7 +10,7 @@ def main() -> None:
     Z = ZBoson()
     alpha = AlphaS(Z.mass2, alpha_QCD_MZ)
 
-    alpha_vals = [alpha(t) for t in t_values]
+    alpha_vals = alpha(t_values)  # Evaluated on the whole array at once.
 
     setFontSizes(factor=font_size_f, all_equal=False)
     fig, ax = plt.subplots(layout='constrained', figsize=(7, 5))
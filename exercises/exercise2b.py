@@ -1,6 +1,6 @@
 import numpy as np
 
-from simulator import Vec4, Particle, MonteCarloIntegrator
+from simulator import Vec4, Vec4Array, EventRecord, Particle, MonteCarloIntegrator
 
 
 def getOutQuarksInfo(integrator: MonteCarloIntegrator, s: float):
@@ -43,27 +43,86 @@ def formEvents(integrator: MonteCarloIntegrator):
     cos_values = integrator.cos_samples
     sin_values = np.sqrt(1. - (cos_values ** 2))
     phi_values = integrator.phi_samples
+    E_values = np.sqrt(s_values) / 2  # Half centre-of-mass energies.
 
     # Get flavour particle ids from 1 to 5.
     flavour_ids = integrator.quark_flavours_samples + 1
 
-    events = []
+    # Outgoing quark and antiquark momenta of all the events.
+    q_momenta = Vec4Array(np.stack((E_values,
+                                    -E_values * np.cos(phi_values) * sin_values,
+                                    -E_values * np.sin(phi_values) * sin_values,
+                                    -E_values * cos_values),
+                                   axis=1))
+    qbar_momenta = Vec4Array(q_momenta.array * [1., -1., -1., -1.])
 
-    for (s, cos, sin, phi, flv) in zip(s_values, cos_values, sin_values, phi_values, flavour_ids):
-        E = np.sqrt(s) / 2  # Half centre-of-mass energy.
+    events = []
 
+    for (E, q_mom, qbar_mom, flv) in zip(E_values.tolist(), q_momenta.to_vec4s(), qbar_momenta.to_vec4s(),
+                                         flavour_ids.tolist()):
         # Incoming electron-positron pair.
         electron = Particle(11, Vec4(E, 0., 0., +E), color=None)
         positron = Particle(-11, Vec4(E, 0., 0., -E), color=None)
 
-        # Outgoing quark momentum.
-        p = np.array([-E * np.cos(phi) * sin, -E * np.sin(phi) * sin, -E * cos])
-
         # Outgoing quark-antiquark pair
-        quark = Particle(flv, Vec4(E, *p), color=[1, 0])
-        antiquark = Particle(-flv, Vec4(E, *(-p)), color=[0, 1])
+        quark = Particle(flv, q_mom, color=[1, 0])
+        antiquark = Particle(-flv, qbar_mom, color=[0, 1])
 
         event = [electron, positron, quark, antiquark]
         events.append(event)
 
     return events
+
+
+def formCanonicalEvents(integrator: MonteCarloIntegrator):
+    """
+    Form a list of events like formEvents, but as EventRecord instances in
+    the frame where the quark moves along the z-axis. The rotation to the
+    lab frame is stored in each record, and only applied when lab-frame
+    momenta are needed, since the jet rates are rotation-invariant.
+
+    :param integrator: Monte Carlo integrator to retrieve
+    :return:
+    """
+
+    # Get values of kinematic variables.
+    s_values = integrator.s_samples
+    cos_values = integrator.cos_samples
+    sin_values = np.sqrt(1. - (cos_values ** 2))
+    phi_values = integrator.phi_samples
+    E_values = np.sqrt(s_values) / 2  # Half centre-of-mass energies.
+
+    # Get flavour particle ids from 1 to 5.
+    flavour_ids = integrator.quark_flavours_samples + 1
+
+    # Rotations taking the z-axis to the direction of the quark, of polar
+    # angle pi - theta and azimuthal angle phi + pi.
+    cos_phi, sin_phi = -np.cos(phi_values), -np.sin(phi_values)
+    cos_theta, sin_theta = -cos_values, sin_values
+    rotations = np.empty((len(s_values), 3, 3))
+    rotations[:, 0] = np.stack((cos_phi * cos_theta, -sin_phi, cos_phi * sin_theta), axis=1)
+    rotations[:, 1] = np.stack((sin_phi * cos_theta, cos_phi, sin_phi * sin_theta), axis=1)
+    rotations[:, 2] = np.stack((-sin_theta, np.zeros_like(sin_theta), cos_theta), axis=1)
+
+    # Incoming beams in the frame of the quark: the z-axis of the lab frame rotated back.
+    beam_directions = rotations[:, 2, :]
+
+    # Initial state in the frame of the quark, set up once for all the events.
+    template = EventRecord(capacity=20)
+    template.append(11, Vec4(0., 0., 0., 0.))
+    template.append(-11, Vec4(0., 0., 0., 0.))
+    template.append(1, Vec4(0., 0., 0., 0.), color=[1, 0])
+    template.append(-1, Vec4(0., 0., 0., 0.), color=[0, 1])
+
+    events = []
+
+    for (k, E) in enumerate(E_values.tolist()):
+        event = template.copy(rotation=rotations[k])
+        event.pid[2:4] = flavour_ids[k], -flavour_ids[k]
+        event.mom[0] = E, *(E * beam_directions[k])
+        event.mom[1] = E, *(-E * beam_directions[k])
+        event.mom[2] = E, 0., 0., E
+        event.mom[3] = E, 0., 0., -E
+        events.append(event)
+
+    return events
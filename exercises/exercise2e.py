@@ -6,35 +6,83 @@ from tqdm import tqdm
 from simulator.constants import alpha_QCD_MZ
 from simulator.integrator import MonteCarloIntegrator, ZBoson
 from simulator.plotting import plotJetHistograms, setFontSizes
-from simulator.utils import AlphaS, Analysis, Shower
+from simulator.utils import (AlphaS, Analysis, BatchShower, EventReader, EventValidator, EventWriter,
+                             ParallelShower, Shower)
 
-from exercise2b import formEvents
+from exercise2b import formEvents, formCanonicalEvents
 
 
 def runAnalysis():
+    if replay_events:
+        # Analyze the showered events stored by a previous run, instead of generating them again.
+        reader = EventReader(events_path)
+        analysis = reader.replay(Analysis(num_variations=reader.num_variations))
+        analysis.finalize(file_name=data_path)
+        return
+
     # Set QCD running coupling and energy scale.
     Z = ZBoson()
     alphas = AlphaS(Z.mass2, alpha_QCD_MZ)
     s = Z.mass2
+    # Alternative strong couplings, for which the events are reweighted on the fly.
+    variations = [AlphaS(Z.mass2, alphas_mz) for alphas_mz in alphas_variations_mz]
+    if batch_shower and variations:
+        exit("The batch shower does not support strong coupling variations.")
 
     integrator = MonteCarloIntegrator(sum_quark_method="random")
     integrator.sampleDeltaSigma(sample_size)
 
-    events = formEvents(integrator)
+    # The jet rates are rotation-invariant, so the events can be showered in the frame of the quark.
+    events = formCanonicalEvents(integrator) if canonical_frame else formEvents(integrator)
 
     # Weights for each event.
     d_sigmas = integrator.d_sigmas
     weights = d_sigmas * 4 * pi
 
-    shower = Shower(alphas)
-    analysis = Analysis()
-
-    for event, weight in zip(tqdm(events), weights):
-        shower.run(event, t=s)  # Running the shower modifies 'event' in-place.
-        analysis.analyze(event, weight)
+    analysis = Analysis(num_variations=len(variations))
+    validator = EventValidator(fraction=validate_fraction, seed=seed) if validate_fraction > 0. else None
+    writer = EventWriter(events_path, num_variations=len(variations)) if save_events else None
+
+    if batch_shower:
+        shower = BatchShower(alphas, seed=seed)
+        shower.run(events, t=s)  # Running the shower modifies 'events' in-place.
+        if validator is not None:
+            # Each event is identified by the state of the random numbers at the start of its batch.
+            validator.validate(events, seeds=[shower.batch_states[k // shower.batch_size]
+                                              for k in range(len(events))])
+        analysis.analyzeBatch(events, weights)  # All the events are clustered at once.
+        if writer is not None:
+            for event, weight in zip(events, weights):
+                writer.write(event, weight)
+    elif n_workers > 1:
+        with ParallelShower(alphas, seed=seed, n_workers=n_workers, validator=validator,
+                            alphas_variations=variations) as shower:
+            shower.run(events, t=s)  # Running the shower modifies 'events' in-place.
+        analysis.analyzeBatch(events, weights, shower.variation_weights)
+        if writer is not None:
+            for event, weight, variation_weights in zip(events, weights, shower.variation_weights.tolist()):
+                writer.write(event, weight, variation_weights)
+    else:
+        shower = Shower(alphas, seed=seed, alphas_variations=variations)
+        for event, weight in zip(tqdm(events), weights):
+            position = shower.rng.position()  # The event can be showered again from UniformStream.from_position.
+            shower.run(event, t=s)  # Running the shower modifies 'event' in-place.
+            if validator is not None:
+                validator.validate([event], seeds=[(seed, position)])
+            analysis.analyze(event, weight, shower.variation_weights)
+            if writer is not None:
+                writer.write(event, weight, shower.variation_weights)
+
+    if writer is not None:
+        writer.close()
 
     analysis.finalize(file_name=data_path)
 
+    if validator is not None:
+        print(f"Event validation: {validator.summary()}")
+        for violation in validator.violations:
+            print(violation)
+
     return
 
 
@@ -65,18 +113,27 @@ def main():
 
 
 if __name__ == '__main__':
-    # NOTE: In order to ensure reproducibility, a seeded random generator has
-    # been declared as a global variable within the utils/shower.py script.
+    # NOTE: In order to ensure reproducibility, the showers use seeded random
+    # generators (one per chunk of events when running on several processes).
 
     repo_dir = str(Path(__file__).parent.parent)  # Path to the repository directory.
     data_dir = repo_dir + "/data/"  # Path to data/
     figs_dir = repo_dir + "/figures/"  # Path to figures/
 
     sample_size = 1_000_000  # Number of events.
+    seed = 42  # Seed of the random numbers of the shower.
 
     load_data = True  # If true, plot(s) are generated from existing data.
+    batch_shower = False  # If true, the events are showered with the (faster) vectorized BatchShower.
+    n_workers = 1  # Number of processes showering the events, if larger than one.
+    canonical_frame = False  # If true, the events are formed and showered with the quark along the z-axis.
+    validate_fraction = 0.01  # Fraction of the showered events checked for momentum and color conservation.
+    alphas_variations_mz = []  # Values of the strong coupling at the Z mass, for which the events are reweighted.
     data_name = f"ex2e-analysis_{sample_size:_.0f}"  # By default, saved to data/
     data_path = data_dir + data_name
+    save_events = False  # If true, the showered events are stored, to be analyzed again with 'replay_events'.
+    replay_events = False  # If true, the stored events are analyzed instead of generating new ones.
+    events_path = data_dir + f"ex2e-events_{sample_size:_.0f}"
 
     save_figs = False
     font_size_div_factor = 0.7  # Adjust font sizes for visibility in document.
@@ -2,9 +2,11 @@ from .constants import *
 from .get_distros import getDistros
 
 from .integrator.particles import Electron, LightQuarks, ZBoson
+from .integrator.batch_integrand import CrossSectionIntegrand
 from .integrator.distributions import Distribution, Dirac, Uniform, BreitWigner
+from .integrator.ensemble import MonteCarloEnsemble
 from .integrator.integrator import MonteCarloIntegrator
-from .integrator.squared_matrix_element import squared_matrix_element
+from .integrator.squared_matrix_element import squared_matrix_element, summed_squared_matrix_element
 
 from .plotting.fontsize import setFontSizes
 from .plotting.grid import plotGrid
@@ -14,7 +16,8 @@ from .plotting.mc_error import plotMonteCarloErrors
 
 from .utils.alphas import AlphaS
 from .utils.analysis import Analysis
-from .utils.particle import Particle
+from .utils.particle import EventRecord, Particle
 from .utils.shower import Shower
 from .utils.vector import Vec4
+from .utils.vector_array import Vec4Array
 from .utils.yoda import plot_jet_histograms
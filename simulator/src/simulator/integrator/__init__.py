@@ -1,4 +1,6 @@
+from .batch_integrand import CrossSectionIntegrand
 from .distributions import Distribution, Dirac, Uniform, BreitWigner
+from .ensemble import MonteCarloEnsemble
 from .integrator import MonteCarloIntegrator
 from .particles import Electron, LightQuarks, ZBoson
-from .squared_matrix_element import squared_matrix_element
+from .squared_matrix_element import differential_cross_section, squared_matrix_element, summed_squared_matrix_element
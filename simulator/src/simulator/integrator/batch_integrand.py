@@ -0,0 +1,50 @@
+"""
+Batched integrand of the electron-positron to quark-antiquark cross-section,
+to be used with the adaptive Monte Carlo integrator of vegas.
+"""
+from __future__ import annotations
+
+import numpy as np
+import vegas
+
+from .squared_matrix_element import differential_cross_section
+
+
+class CrossSectionIntegrand(vegas.BatchIntegrand):
+    """
+    Differential cross-section, summed over light-quark flavours and weighted by the beam spectrum
+    'beam_distro', evaluated on whole batches of points (s, cos theta, phi) at once.
+
+    vegas passes the points as an array of shape (batch size, 3) and receives the values
+    as an array of shape (batch size,), avoiding the Python overhead per point.
+
+    If 's_distro' is given, the first variable is instead uniformly distributed in [0, 1) and
+    mapped to 's' through the inverse cumulative distribution function of 's_distro'. The
+    integrand then includes the corresponding Jacobian 1/g(s).
+
+    Example usage, for a flat beam spectrum between s_min and s_max:
+
+      integrand = CrossSectionIntegrand(Uniform(s_min, s_max))
+      integrator = vegas.Integrator([[s_min, s_max], [-1, 1], [0, 2 * np.pi]])
+      sigma = integrator(integrand, nitn=10, neval=1000)
+    """
+    def __init__(self, beam_distro, s_distro=None):
+        self._beam_distro = beam_distro
+        self._s_distro = s_distro
+
+    def __repr__(self):
+        class_name = type(self).__name__
+        return f"{class_name}(beam_distro={self._beam_distro}, s_distro={self._s_distro})"
+
+    def __call__(self, x):
+        x = np.asarray(x)
+        s_values, cos_vals = x[:, 0], x[:, 1]
+
+        jacobian = 1.
+        if self._s_distro is not None:
+            s_values = self._s_distro.inverse_cdf(s_values)
+            jacobian = 1. / self._s_distro.evaluate_distro(s_values)
+
+        f_s = self._beam_distro.evaluate_distro(s_values)  # Beam spectrum distribution.
+
+        return differential_cross_section(s_values, cos_vals, f_s * jacobian)
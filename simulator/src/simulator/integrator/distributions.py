@@ -13,17 +13,46 @@ class Distribution:
     """
     Basic distribution class with a sampling method
     and an expression to evaluate values on it.
+    Optionally, the inverse of its cumulative distribution function
+    maps uniform values in [0, 1) to values of the distribution, and
+    its support gives the interval where the distribution is non-zero.
     """
-    def __init__(self, sample_method, evaluate_distro):
+    def __init__(self, sample_method, evaluate_distro, inverse_cdf=None, support=(-np.inf, np.inf)):
         self._sample_method = sample_method
         self._evaluate_distro = evaluate_distro
+        self._inverse_cdf = inverse_cdf
+        self._support = support
 
-    def sample(self, sample_size):
-        return self._sample_method(sample_size)
+    @property
+    def support(self):
+        return self._support
+
+    def sample(self, sample_size, rng=None, dtype=None):
+        """
+        Draw 'sample_size' values. If a random number generator 'rng' is given, it is
+        used instead of the generator of the distribution. If a floating-point 'dtype'
+        is given, the values are drawn with that precision instead of float64. The
+        sampling method must accept each of these given options as keyword argument.
+        """
+        options = {}
+        if rng is not None:
+            options["rng"] = rng
+        if dtype is not None:
+            options["dtype"] = dtype
+        return self._sample_method(sample_size, **options)
 
     def evaluate_distro(self, variables):
         return self._evaluate_distro(variables)
 
+    def inverse_cdf(self, uniforms):
+        if self._inverse_cdf is None:
+            exit(f"Distribution {type(self).__name__} does not have an inverse cumulative distribution function.")
+        return self._inverse_cdf(uniforms)
+
+    def in_support(self, variables):
+        lower, upper = self._support
+        return (variables >= lower) & (variables <= upper)
+
 
 class Dirac(Distribution):
     """
@@ -32,9 +61,11 @@ class Dirac(Distribution):
     """
     def __init__(self, x0: int | float):
         self._x0 = x0  # Root of the Dirac delta.
-        def sample_method(sample_size: int): return np.ones(sample_size) * self._x0
+        def sample_method(sample_size: int, rng=None, dtype=np.float64):
+            return np.full(sample_size, self._x0, dtype=dtype)
         def evaluate_distro(_): return 1
-        super().__init__(sample_method, evaluate_distro)
+        def inverse_cdf(uniforms): return np.ones(np.shape(uniforms)) * self._x0
+        super().__init__(sample_method, evaluate_distro, inverse_cdf, support=(x0, x0))
 
     def __repr__(self):
         distro_name = type(self).__name__
@@ -56,12 +87,20 @@ class Uniform(Distribution):
         self._upper = upper
         self._rng = rng if rng is not None else np.random.default_rng()
 
-        def sample_method(sample_size: int):
-            return self._rng.uniform(self._lower, self._upper, sample_size)
+        def sample_method(sample_size: int, rng=None, dtype=np.float64):
+            rng = self._rng if rng is None else rng
+            dtype = np.dtype(dtype)
+            if dtype == np.float64:
+                return rng.uniform(self._lower, self._upper, sample_size)
+            uniforms = rng.random(sample_size, dtype=dtype)
+            return dtype.type(self._upper - self._lower) * uniforms + dtype.type(self._lower)
 
         def evaluate_distro(_): return 1. / (self._upper - self._lower)
 
-        super().__init__(sample_method=sample_method, evaluate_distro=evaluate_distro)
+        def inverse_cdf(uniforms): return self._lower + (self._upper - self._lower) * uniforms
+
+        super().__init__(sample_method=sample_method, evaluate_distro=evaluate_distro, inverse_cdf=inverse_cdf,
+                         support=(lower, upper))
 
     def __repr__(self):
         distro_name = type(self).__name__
@@ -101,10 +140,16 @@ class BreitWigner(Distribution):
         self._rho_max = self.getRho(s_max)
         self._rng = rng if rng is not None else np.random.default_rng()
 
-        def sample_method(sample_size):
-            rho_values = self._rng.uniform(self._rho_min, self._rho_max, sample_size)
+        def sample_method(sample_size, rng=None, dtype=np.float64):
+            rng = self._rng if rng is None else rng
+            dtype = np.dtype(dtype)
+            if dtype == np.float64:
+                rho_values = rng.uniform(self._rho_min, self._rho_max, sample_size)
+            else:
+                uniforms = rng.random(sample_size, dtype=dtype)
+                rho_values = dtype.type(self._rho_max - self._rho_min) * uniforms + dtype.type(self._rho_min)
             s_sample = (self._mass * self._width * np.tan(rho_values)) + (self._mass ** 2)
-            return s_sample
+            return s_sample.astype(dtype, copy=False)
 
         def evaluate_distro(s_values: int | float | np.ndarray):
             denominator = (s_values - (self._mass ** 2)) ** 2 + (self._mass * self._width) ** 2
@@ -112,7 +157,12 @@ class BreitWigner(Distribution):
             g_s *= (self._mass * self._width) / (self._rho_max - self._rho_min)  # Normalization factor.
             return g_s
 
-        super().__init__(sample_method=sample_method, evaluate_distro=evaluate_distro)
+        def inverse_cdf(uniforms):
+            rho_values = self._rho_min + (self._rho_max - self._rho_min) * uniforms
+            return (self._mass * self._width * np.tan(rho_values)) + (self._mass ** 2)
+
+        super().__init__(sample_method=sample_method, evaluate_distro=evaluate_distro, inverse_cdf=inverse_cdf,
+                         support=(s_min, s_max))
 
     def __repr__(self):
         distro_name = type(self).__name__
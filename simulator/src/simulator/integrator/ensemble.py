@@ -0,0 +1,125 @@
+"""
+Integration of the cross-section for several configurations of the
+Monte Carlo integrator with common random numbers.
+"""
+from __future__ import annotations
+
+import numpy as np
+
+from simulator.constants import N_q
+from .distributions import Dirac
+from .particles import ZBoson
+from .squared_matrix_element import differential_cross_section
+
+
+Z = ZBoson()
+
+
+class MonteCarloEnsemble:
+    """
+    Monte Carlo integration of the electron-positron to quark-antiquark cross-section
+    for several configurations at once, all evaluated on the same set of uniform random numbers.
+
+    Each configuration is a dictionary with (optional) keys 's_distro', 'beam_distro' and
+    'sum_quark_method', with the same meaning and defaults as in the MonteCarloIntegrator.
+    The distributions for 's' must implement 'inverse_cdf'. The values of 'cos_theta' are
+    uniformly distributed in [-1, 1), and 'phi' is integrated out, since the cross-section
+    does not depend on it.
+
+    Since the configurations share their random numbers, the estimates are correlated, and
+    the errors of their differences are usually much smaller than those of independent runs.
+
+    'seed' specifies the seed of the random number generator.
+    """
+    def __init__(self, configurations: list[dict], seed: int = 42):
+        self._seed = seed
+        self.rng = np.random.default_rng(seed=self._seed)
+
+        self._s_distros = []
+        self._beam_distros = []
+        self._sum_quark_methods = []
+        for configuration in configurations:
+            sum_quark_method = configuration.get("sum_quark_method", "explicit")
+            if sum_quark_method not in ["explicit", "random"]:
+                exit(f"Method to sum quark flavours: '{sum_quark_method}' not implemented.")
+
+            self._s_distros.append(configuration.get("s_distro", Dirac(Z.mass2)))
+            self._beam_distros.append(configuration.get("beam_distro", Dirac(Z.mass2)))
+            self._sum_quark_methods.append(sum_quark_method)
+
+        # Cross-section estimates of each configuration for every Monte Carlo point.
+        self._weights = np.empty((len(configurations), 0))
+
+    def __repr__(self):
+        class_name = type(self).__name__
+        configurations = [{"s_distro": s_distro, "beam_distro": beam_distro, "sum_quark_method": method}
+                          for (s_distro, beam_distro, method)
+                          in zip(self._s_distros, self._beam_distros, self._sum_quark_methods)]
+        return f"{class_name}(configurations={configurations}, seed={self._seed})"
+
+    @property
+    def weights(self):
+        return np.copy(self._weights)
+
+    def sampleDeltaSigma(self, N):
+        num_samples = self._weights.shape[1]  # Current amount of samples.
+
+        if num_samples > N:  # There are enough samples already.
+            return
+
+        sample_size = N if num_samples == 0 else N - num_samples
+
+        # Common random numbers for all the configurations.
+        s_uniforms = self.rng.random(sample_size)
+        cos_vals = self.rng.uniform(-1., 1., sample_size)
+        q_flavours = self.rng.integers(0, N_q, sample_size)
+
+        weights = np.empty((len(self._s_distros), sample_size))
+        for (k, (s_distro, beam_distro, method)) in enumerate(zip(self._s_distros, self._beam_distros,
+                                                                   self._sum_quark_methods)):
+            s_values = s_distro.inverse_cdf(s_uniforms)
+            f_s = beam_distro.evaluate_distro(s_values)  # Beam spectrum distribution.
+
+            d_sigmas = differential_cross_section(s_values, cos_vals, f_s,
+                                                  q_flavours if method == "random" else None)
+
+            # Divide by the distributions of s, cos theta (1/2) and phi (1/(2 pi)).
+            weights[k] = d_sigmas * (4 * np.pi) / s_distro.evaluate_distro(s_values)
+
+        self._weights = np.append(self._weights, weights, axis=1)
+
+        return
+
+    def integrateCrossSections(self) -> list[tuple[float, float]]:
+        """
+        Estimate the cross-section for each configuration.
+
+        :return: List with the cross-section and its Monte Carlo error estimate for each configuration.
+        """
+        N = self._weights.shape[1]
+        if N == 0:
+            exit("No samples for the differential cross-section have been generated.")
+
+        sigma_avgs = np.sum(self._weights, axis=1) / N
+        sigma2_avgs = np.sum(self._weights ** 2, axis=1) / N
+        mc_errs = np.sqrt((sigma2_avgs - (sigma_avgs ** 2)) / N)
+
+        return list(zip(sigma_avgs, mc_errs))
+
+    def integrateDifference(self, i: int, j: int) -> tuple[float, float]:
+        """
+        Estimate the difference between the cross-sections of the configurations i and j. Since both are
+        evaluated on the same points, the error estimate accounts for their correlation.
+
+        :return: Difference of the cross-sections and its Monte Carlo error estimate.
+        """
+        N = self._weights.shape[1]
+        if N == 0:
+            exit("No samples for the differential cross-section have been generated.")
+
+        differences = self._weights[i] - self._weights[j]
+        diff_avg = np.sum(differences) / N
+        diff2_avg = np.sum(differences ** 2) / N
+        mc_err = np.sqrt((diff2_avg - (diff_avg ** 2)) / N)
+
+        return diff_avg, mc_err
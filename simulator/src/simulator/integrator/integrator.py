@@ -1,11 +1,13 @@
 from __future__ import annotations
 
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 
-from simulator.constants import f_conv, N_q
+from simulator.constants import N_q
 from .distributions import Dirac, Uniform
 from .particles import ZBoson
-from .squared_matrix_element import squared_matrix_element
+from .squared_matrix_element import differential_cross_section
 
 
 Z = ZBoson()
@@ -23,13 +25,36 @@ class MonteCarloIntegrator:
     a random flavour for each Monte Carlo point, takes the average, and multiplies by the number of flavours (here 5).
 
     'seed' specifies the seed of the random number generator.
+
+    If 'lazy_phi' is True, the values of 'phi' (on which the cross-section does not depend) are not drawn
+    when sampling. Instead, the position of the random number stream is stored and the stream is advanced
+    as if they had been drawn, so that they are generated with the exact same values only when requested
+    through 'phi_samples'. This requires a Uniform distribution for 'phi'.
+
+    If 'n_threads' is larger than 1, each call to 'sampleDeltaSigma' splits the new points between that
+    many threads. Each thread draws from its own generator, spawned from 'seed', so the samples are
+    reproducible for a fixed number of threads (but differ from those of the single-threaded integrator).
+    NumPy releases the GIL in the sampling and evaluation of large arrays, so the threads run in parallel.
+
+    'dtype' sets the floating-point precision used to sample, evaluate and store the Monte Carlo points.
+    Single precision (float32) halves the memory and bandwidth needed, while the sums in
+    'integrateCrossSection' are still accumulated in double precision. Its accuracy can be checked with
+    'checkSinglePrecision'. Lazy sampling of phi is only available in double precision.
     """
     def __init__(self, s_distro=None, cos_theta_distro=None, phi_distro=None, beam_distro=None,
-                 sum_quark_method="explicit", seed: int = 42):
+                 sum_quark_method="explicit", seed: int = 42, lazy_phi: bool = False, n_threads: int = 1,
+                 dtype=np.float64):
 
         self._seed = seed
+        self._dtype = np.dtype(dtype)
+        # Distributions are only asked for a dtype in single precision, so that custom ones keep working.
+        self._sample_dtype = None if self._dtype == np.float64 else self._dtype
         self.rng = np.random.default_rng(seed=self._seed)
 
+        self._n_threads = n_threads
+        seed_sequences = np.random.SeedSequence(self._seed).spawn(self._n_threads)
+        self._thread_rngs = [np.random.default_rng(seed_sequence) for seed_sequence in seed_sequences]
+
         ##############
         # s sampling #
         ##############
@@ -39,7 +64,7 @@ class MonteCarloIntegrator:
             self._s_distro = None
             self._setVariableDistro("_s_distro", s_distro)
 
-        self._s_values = np.array([])
+        self._s_values = np.array([], dtype=self._dtype)
 
         ######################
         # cos theta sampling #
@@ -50,7 +75,7 @@ class MonteCarloIntegrator:
             self._cos_distro = None
             self._setVariableDistro("_cos_distro", cos_theta_distro)
 
-        self._cos_vals = np.array([])
+        self._cos_vals = np.array([], dtype=self._dtype)
 
         ################
         # phi sampling #
@@ -61,7 +86,15 @@ class MonteCarloIntegrator:
             self._phi_distro = None
             self._setVariableDistro("_phi_distro", phi_distro)
 
-        self._phi_vals = np.array([])
+        self._lazy_phi = lazy_phi
+        if self._lazy_phi and not isinstance(self._phi_distro, Uniform):
+            exit("Lazy sampling of phi requires a Uniform distribution for phi.")
+        if self._lazy_phi and self._dtype != np.float64:
+            exit("Lazy sampling of phi is only available in double precision.")
+
+        self._phi_vals = np.array([], dtype=self._dtype)
+        self._phi_streams = []  # Stream positions and sizes of the phi values not yet generated.
+        self._sample_calls = []  # Sample sizes requested from 'sampleDeltaSigma', to check lazy sampling.
 
         #####################
         # beam distribution #
@@ -76,16 +109,18 @@ class MonteCarloIntegrator:
         # sum over quark flavours #
         ###########################
         self._sum_quark_method = sum_quark_method
-        self._sum_over_quarks = self._setQuarkMethod()
+        if self._sum_quark_method not in ["explicit", "random"]:
+            exit(f"Method to sum quark flavours: '{self._sum_quark_method}' not implemented.")
         self._quark_flavours = np.array([], dtype=int)
 
-        self._d_sigmas = np.array([])
+        self._d_sigmas = np.array([], dtype=self._dtype)
 
     def __repr__(self):
         class_name = type(self).__name__
         return f"{class_name}(s_distro={self._s_distro}, cos_theta_distro={self._cos_distro}, " \
                f"phi_distro={self._phi_distro}, beam_distro={self._beam_distro}, " \
-               f"sum_quark_method={self._sum_quark_method}, seed={self._seed})"
+               f"sum_quark_method={self._sum_quark_method}, seed={self._seed}, lazy_phi={self._lazy_phi}, " \
+               f"n_threads={self._n_threads}, dtype={self._dtype})"
 
     @property
     def s_samples(self):
@@ -97,6 +132,7 @@ class MonteCarloIntegrator:
 
     @property
     def phi_samples(self):
+        self._generateLazyPhi()
         return np.copy(self._phi_vals)
 
     @property
@@ -119,29 +155,28 @@ class MonteCarloIntegrator:
         setattr(getattr(self, inst_variable), "rng", self.rng)
         return
 
-    def _setQuarkMethod(self):
-        if self._sum_quark_method == "explicit":
-            def sum_over_quarks(s_values, cos_vals, _):
-                Mq = [squared_matrix_element(s_values, cos_vals, q) for q in range(N_q)]
-                q_sum = np.sum(Mq, axis=0)
-                return q_sum
-
-        elif self._sum_quark_method == "random":
-            def sum_over_quarks(s_values, cos_vals, _):
-                sample_size = cos_vals.size
-                q_flavours = self.rng.integers(0, N_q, sample_size)
-                q_sum = N_q * squared_matrix_element(s_values, cos_vals, q_flavours)
-                self._quark_flavours = np.append(self._quark_flavours, q_flavours)
-                return q_sum
+    def _generateLazyPhi(self):
+        """
+        Generate the values of phi whose sampling was postponed, by replaying
+        the random number stream from each of the stored positions.
+        """
+        if not self._phi_streams:
+            return
 
-        else:
-            exit(f"Method to sum quark flavours: '{self._sum_quark_method}' not implemented.")
+        phi_batches = [self._phi_vals]
+        for (state, sample_size) in self._phi_streams:
+            replay_rng = np.random.Generator(getattr(np.random, state["bit_generator"])())
+            replay_rng.bit_generator.state = state
+            phi_batches.append(self._phi_distro.sample(sample_size, rng=replay_rng))
 
-        return sum_over_quarks
+        self._phi_vals = np.concatenate(phi_batches)
+        self._phi_streams = []
+        return
 
     def _divideByDistros(self, integrand) -> np.ndarray:
         s_distro_vals = self._s_distro.evaluate_distro(self._s_values)
         cos_dist_vals = self._cos_distro.evaluate_distro(self._cos_vals)
+        # A lazy phi is uniformly distributed, so its distribution does not depend on the (missing) values.
         phi_dist_vals = self._phi_distro.evaluate_distro(self._phi_vals)
 
         ratios = np.divide(integrand, s_distro_vals)
@@ -150,6 +185,87 @@ class MonteCarloIntegrator:
 
         return ratios
 
+    def _evaluateDeltaSigma(self, s_values, cos_vals, q_flavours):
+        f_s = self._beam_distro.evaluate_distro(s_values)  # Beam spectrum distribution.
+
+        # The flavours are None (summed explicitly) for the 'explicit' quark sum method.
+        return differential_cross_section(s_values, cos_vals, f_s, q_flavours)
+
+    def _sampleDistro(self, distro, sample_size: int, rng=None):
+        """
+        Sample 'sample_size' values of a distribution. The generator 'rng' and the dtype are only passed
+        when they are needed (by the threads, and in single precision), so that custom distributions whose
+        'sample' method only takes the sample size keep working.
+        """
+        options = {}
+        if rng is not None:
+            options["rng"] = rng
+        if self._sample_dtype is not None:
+            options["dtype"] = self._sample_dtype
+        return distro.sample(sample_size, **options)
+
+    def _sampleBlock(self, sample_size: int, rng=None):
+        """
+        Sample the kinematic variables (and quark flavours) and evaluate the differential cross-section
+        for a block of points. The values are drawn from 'rng' if given, and from the generator of each
+        distribution otherwise.
+
+        :return: Values of s, cos theta, phi, quark flavours and differential cross-section. If phi is lazy,
+         its stream position and sample size are returned instead of its values. The quark flavours are None
+         for the 'explicit' quark sum method.
+        """
+        block_rng = self.rng if rng is None else rng
+
+        s_values = self._sampleDistro(self._s_distro, sample_size, rng)
+        cos_vals = self._sampleDistro(self._cos_distro, sample_size, rng)
+        if self._lazy_phi:
+            # Store the stream position and skip one draw per value, as uniform sampling would do.
+            state = block_rng.bit_generator.state
+            phi_vals = (state, sample_size)
+            block_rng.bit_generator.advance(sample_size)
+            # Advancing drops the buffered 32-bit half of a draw (used for integers), which sampling keeps.
+            advanced_state = block_rng.bit_generator.state
+            advanced_state["has_uint32"], advanced_state["uinteger"] = state["has_uint32"], state["uinteger"]
+            block_rng.bit_generator.state = advanced_state
+        else:
+            phi_vals = self._sampleDistro(self._phi_distro, sample_size, rng)
+
+        q_flavours = None
+        if self._sum_quark_method == "random":
+            q_flavours = block_rng.integers(0, N_q, sample_size)
+
+        d_sigmas = self._evaluateDeltaSigma(s_values, cos_vals, q_flavours)
+
+        return s_values, cos_vals, phi_vals, q_flavours, d_sigmas
+
+    def _sampleThreaded(self, sample_size: int):
+        """
+        Split the sampling of 'sample_size' points into one contiguous slice per thread. Each thread draws
+        from its own generator and fills its slice of the preallocated arrays, so the result does not depend
+        on the order in which the threads run.
+        """
+        bounds = np.linspace(0, sample_size, self._n_threads + 1).astype(int)
+
+        s_values = np.empty(sample_size, dtype=self._dtype)
+        cos_vals = np.empty(sample_size, dtype=self._dtype)
+        phi_vals = [None] * self._n_threads if self._lazy_phi else np.empty(sample_size, dtype=self._dtype)
+        q_flavours = None if self._sum_quark_method == "explicit" else np.empty(sample_size, dtype=int)
+        d_sigmas = np.empty(sample_size, dtype=self._dtype)
+
+        def fillSlice(k):
+            lower, upper = bounds[k], bounds[k + 1]
+            block = self._sampleBlock(upper - lower, rng=self._thread_rngs[k])
+            s_values[lower:upper], cos_vals[lower:upper] = block[0], block[1]
+            phi_vals[k if self._lazy_phi else slice(lower, upper)] = block[2]
+            if q_flavours is not None:
+                q_flavours[lower:upper] = block[3]
+            d_sigmas[lower:upper] = block[4]
+
+        with ThreadPoolExecutor(max_workers=self._n_threads) as executor:
+            list(executor.map(fillSlice, range(self._n_threads)))
+
+        return s_values, cos_vals, phi_vals, q_flavours, d_sigmas
+
     def sampleDeltaSigma(self, N):
         num_samples = np.size(self._d_sigmas)  # Current amount of samples.
 
@@ -157,19 +273,24 @@ class MonteCarloIntegrator:
             return
 
         sample_size = N if num_samples == 0 else N - num_samples
+        self._sample_calls.append(N)
 
-        s_values = self._s_distro.sample(sample_size)
-        cos_vals = self._cos_distro.sample(sample_size)
-        phi_vals = self._phi_distro.sample(sample_size)
-        f_s = self._beam_distro.evaluate_distro(s_values)  # Beam spectrum distribution.
-
-        d_sigmas = self._sum_over_quarks(s_values, cos_vals, phi_vals)
-        d_sigmas *= (f_conv * f_s) / (64 * (np.pi ** 2) * s_values)
+        if self._n_threads > 1:
+            s_values, cos_vals, phi_vals, q_flavours, d_sigmas = self._sampleThreaded(sample_size)
+        else:
+            s_values, cos_vals, phi_vals, q_flavours, d_sigmas = self._sampleBlock(sample_size)
 
         # Add to lists to record the values.
         self._s_values = np.append(self._s_values, s_values)
         self._cos_vals = np.append(self._cos_vals, cos_vals)
-        self._phi_vals = np.append(self._phi_vals, phi_vals)
+        if not self._lazy_phi:
+            self._phi_vals = np.append(self._phi_vals, phi_vals)
+        elif self._n_threads > 1:
+            self._phi_streams.extend(phi_vals)
+        else:
+            self._phi_streams.append(phi_vals)
+        if q_flavours is not None:
+            self._quark_flavours = np.append(self._quark_flavours, q_flavours)
         self._d_sigmas = np.append(self._d_sigmas, d_sigmas)
 
         return
@@ -179,12 +300,87 @@ class MonteCarloIntegrator:
         if N == 0:
             exit("No samples for the differential cross-section have been generated.")
 
-        # Cross-section estimator.
+        # Cross-section estimator (sums are accumulated in double precision).
         d_sigmas = self._divideByDistros(self._d_sigmas)
-        sigma_avg = np.sum(d_sigmas) / N
+        sigma_avg = np.sum(d_sigmas, dtype=np.float64) / N
 
         # Monte Carlo error estimate.
-        sigma2_avg = np.sum(d_sigmas ** 2) / N
+        sigma2_avg = np.sum(d_sigmas ** 2, dtype=np.float64) / N
         mc_err = np.sqrt((sigma2_avg - (sigma_avg ** 2)) / N)
 
         return sigma_avg, mc_err
+
+    def reweightCrossSection(self, s_distro=None, beam_distro=None) -> tuple[float, float, float, float]:
+        """
+        Estimate the cross-section for alternative distributions of 's' and of the beam spectrum 'f(s)',
+        reusing the stored samples instead of sampling again. Distributions not given are kept.
+
+        Each point gets the weight W = d_sigma / g_old(s) * f_new(s) / f_old(s), which vanishes outside the
+        support of the new beam spectrum. The cross-section is the average of these weights, and does not
+        depend on the new distribution 'g_new' of 's', which only enters the predicted error of an integrator
+        sampling 's' from it with the same sample size.
+
+        :param s_distro: Alternative distribution of 's'.
+        :param beam_distro: Alternative beam spectrum 'f(s)'.
+        :return: Cross-section, its Monte Carlo error estimate, the effective sample size (sum W)^2 / (sum W^2)
+         of the weights, and the Monte Carlo error predicted when sampling 's' from 'g_new'. An effective
+         sample size much smaller than the one of the original weights (e.g. because many points fall
+         outside the new beam spectrum) means that the reweighted estimate is not reliable.
+        """
+        N = np.size(self._d_sigmas)
+        if N == 0:
+            exit("No samples for the differential cross-section have been generated.")
+
+        s_distro = self._s_distro if s_distro is None else s_distro
+        beam_distro = self._beam_distro if beam_distro is None else beam_distro
+        if isinstance(s_distro, Dirac) != isinstance(self._s_distro, Dirac):
+            exit("Cannot reweight between a Dirac and a continuous distribution for s.")
+
+        s_values = self._s_values.astype(np.float64)
+
+        # Weights of the points for the new beam spectrum, vanishing outside of its support.
+        beam_ratios = beam_distro.evaluate_distro(s_values) / self._beam_distro.evaluate_distro(s_values)
+        beam_ratios = np.where(beam_distro.in_support(s_values), beam_ratios, 0.)
+        weights = self._divideByDistros(self._d_sigmas).astype(np.float64) * beam_ratios
+
+        # Cross-section and Monte Carlo error estimate of the reweighted sample.
+        sigma_avg = np.sum(weights) / N
+        sigma2_avg = np.sum(weights ** 2) / N
+        mc_err = np.sqrt((sigma2_avg - (sigma_avg ** 2)) / N)
+        effective_size = (np.sum(weights) ** 2) / (N * sigma2_avg) if sigma2_avg > 0 else 0.
+
+        # Monte Carlo error predicted when sampling from the new distribution, from the likelihood-ratio
+        # weights g_new(s)/g_old(s), vanishing outside the support of the new distribution.
+        lr_weights = s_distro.evaluate_distro(s_values) / self._s_distro.evaluate_distro(s_values)
+        lr_weights = np.where(s_distro.in_support(s_values), lr_weights, 0.)
+        positive = lr_weights > 0.
+        predicted_sigma2_avg = np.sum(weights[positive] ** 2 / lr_weights[positive]) / N
+        predicted_mc_err = np.sqrt((predicted_sigma2_avg - (sigma_avg ** 2)) / N)
+
+        return sigma_avg, mc_err, effective_size, predicted_mc_err
+
+    def checkSinglePrecision(self) -> tuple[float, float, float]:
+        """
+        Check the accuracy of the single-precision mode, by evaluating the differential cross-section
+        on the same sampled points in double precision.
+
+        :return: Cross-section estimates in the precision of the integrator and in double precision, and
+         their relative deviation. The latter should be far below the relative Monte Carlo error.
+        """
+        N = np.size(self._d_sigmas)
+        if N == 0:
+            exit("No samples for the differential cross-section have been generated.")
+
+        sigma_avg = self.integrateCrossSection()[0]
+
+        s_values = self._s_values.astype(np.float64)
+        cos_vals = self._cos_vals.astype(np.float64)
+        q_flavours = self._quark_flavours if self._sum_quark_method == "random" else None
+
+        d_sigmas = self._evaluateDeltaSigma(s_values, cos_vals, q_flavours)
+        d_sigmas /= self._s_distro.evaluate_distro(s_values)
+        d_sigmas /= self._cos_distro.evaluate_distro(cos_vals)
+        d_sigmas /= self._phi_distro.evaluate_distro(self._phi_vals.astype(np.float64))
+        sigma_double = np.sum(d_sigmas) / N
+
+        return sigma_avg, sigma_double, abs(sigma_avg - sigma_double) / abs(sigma_double)
@@ -1,11 +1,15 @@
 """
 Definition of the squared matrix element for the electron-positron
 to quark-antiquark cross-section to leading order.
+
+The squared matrix element is linear in the couplings of the quarks, so that
+it is evaluated from a table of coupling coefficients, with one row per
+light-quark flavour. The sum over flavours only requires summing the rows once.
 """
 from __future__ import annotations
 
 import numpy as np
-from simulator.constants import alpha_QED, kappa, QCD_colors
+from simulator.constants import alpha_QED, f_conv, kappa, N_q, QCD_colors
 from .particles import Electron, LightQuarks, ZBoson
 
 
@@ -23,17 +27,65 @@ def chi_funcs(s: float | np.ndarray):
     return chi1, chi2
 
 
-def squared_matrix_element(s: float | np.ndarray, cos_theta: float | np.ndarray, q: int | np.ndarray):
+def coupling_coefficients() -> np.ndarray:
+    """
+    Coefficients of the squared matrix element for each light-quark flavour (rows).
+    The columns multiply 1, chi1 and chi2 in the (1 + cos^2 theta) term, and chi1
+    and chi2 in the cos theta term, respectively.
+    """
+    coefficients = np.stack([(e.charge * Q.charges) ** 2,
+                             2 * e.charge * e.V * Q.charges * Q.vector_couplings,
+                             e.squared_coupling * Q.squared_couplings,
+                             4 * e.charge * Q.charges * e.A * Q.axial_couplings,
+                             8 * e.A * e.V * Q.axial_couplings * Q.vector_couplings],
+                            axis=1)
+    return coefficients
+
+
+_coefficients = coupling_coefficients()
+_summed_coefficients = np.sum(_coefficients, axis=0)
+
+
+def _evaluate(s, cos_theta, coefficients):
+    # Evaluate in the precision of the kinematic variables (e.g. float32), not in that of the couplings.
+    dtype = np.result_type(s, cos_theta)
+    c0, c1, c2, d1, d2 = np.moveaxis(np.asarray(coefficients, dtype=dtype), -1, 0)
+
     chi1, chi2 = chi_funcs(s)
 
-    curly_brackets1 = (e.charge * Q.charge(q)) ** 2 + \
-                      (2 * e.charge * e.V * Q.charge(q) * Q.V(q) * chi1) + \
-                      (e.squared_coupling * Q.squared_coupling(q) * chi2)
-    curly_brackets2 = (4 * e.charge * Q.charge(q) * e.A * Q.A(q) * chi1) + \
-                      (8 * e.A * e.V * Q.A(q) * Q.V(q) * chi2)
+    curly_brackets1 = c0 + (c1 * chi1) + (c2 * chi2)
+    curly_brackets2 = (d1 * chi1) + (d2 * chi2)
 
     m_sqr = ((1. + cos_theta ** 2) * curly_brackets1) + (cos_theta * curly_brackets2)
     m_sqr *= (4. * np.pi * alpha_QED) ** 2
     m_sqr *= QCD_colors
 
     return m_sqr
+
+
+def squared_matrix_element(s: float | np.ndarray, cos_theta: float | np.ndarray, q: int | np.ndarray):
+    return _evaluate(s, cos_theta, _coefficients[q])
+
+
+def summed_squared_matrix_element(s: float | np.ndarray, cos_theta: float | np.ndarray):
+    """
+    Squared matrix element summed over all light-quark flavours,
+    evaluated in a single pass with the summed coupling coefficients.
+    """
+    return _evaluate(s, cos_theta, _summed_coefficients)
+
+
+def differential_cross_section(s: float | np.ndarray, cos_theta: float | np.ndarray, f_s: float | np.ndarray,
+                               q: int | np.ndarray | None = None):
+    """
+    Differential cross-section in s, cos theta and phi, weighted by the beam spectrum values 'f_s'.
+    The light-quark flavours are summed explicitly if 'q' is None, and otherwise estimated as N_q
+    times the contribution of the (randomly sampled) flavours 'q'.
+    """
+    if q is None:
+        d_sigmas = summed_squared_matrix_element(s, cos_theta)
+    else:
+        d_sigmas = N_q * squared_matrix_element(s, cos_theta, q)
+    d_sigmas *= (f_conv * f_s) / (64 * (np.pi ** 2) * s)
+
+    return d_sigmas
@@ -1,6 +1,13 @@
 from .alphas import AlphaS
 from .analysis import Analysis
-from .particle import Particle
+from .particle import EventRecord, Particle, ParticleView
+from .batch_shower import BatchShower
+from .event_file import EventChunk, EventReader, EventWriter
+from .event_validator import EventValidator, EventViolation
+from .parallel_shower import ParallelShower
+from .random_stream import UniformStream
 from .shower import Shower
+from .shower_stats import ShowerStats
 from .vector import Vec4
+from .vector_array import Vec4Array
 from .yoda import plot_jet_histograms
@@ -1,4 +1,7 @@
-from numpy import pi, log
+import math as m
+
+import numpy as np
+from numpy import pi
 
 from .qcd_group_constants import *
 
@@ -9,6 +12,10 @@ class AlphaS:
     the 0th and the 1st (=default) perturbative order.
     The starting point of the evolution is assumed to be \\alpha_s(\\m_Z**2).
 
+    The coefficients of the running in each flavour region (5, 4 and 3 light
+    flavours, separated by the b and c thresholds) are computed once. The scale
+    can be a number or a NumPy array.
+
     Examples usage, printing the strong coupling value at a scale of
     100 GeV**2:
 
@@ -24,8 +31,15 @@ class AlphaS:
         self.mb2 = squared_m_b
         self.mz2 = squared_m_Z
         self.at_sqr_mz = alphas_at_squared_m_Z
+        # coefficients (t_min, t_ref, alpha_ref, 1/alpha_ref, b0, b0*alpha_ref, b1/b0*alpha_ref)
+        # of each flavour region, in decreasing order of the scale
+        self._regions = []
+        self._addRegion(self.mb2, self.mz2, self.at_sqr_mz, 5)
         self.at_sqr_mb = self(self.mb2)
+        self._addRegion(self.mc2, self.mb2, self.at_sqr_mb, 4)
         self.at_sqr_mc = self(self.mc2)
+        self._addRegion(-np.inf, self.mc2, self.at_sqr_mc, 3)
+        self._region_arrays = np.array(self._regions).T
 
     @staticmethod
     def beta0(n_light_flavours):
@@ -35,41 +49,38 @@ class AlphaS:
     def beta1(n_light_flavours):
         return 17. / 6. * CA * CA - (5. / 3. * CA + CF) * TR * n_light_flavours
 
+    def _addRegion(self, t_min, t_ref, alpha_ref, n_light_flavours):
+        b0 = self.beta0(n_light_flavours)/(2.*pi)
+        b1 = self.beta1(n_light_flavours)/pow(2.*pi, 2)
+        self._regions.append((t_min, t_ref, alpha_ref, 1./alpha_ref, b0, b0*alpha_ref, b1/b0*alpha_ref))
+
+    def region(self, t):
+        """Coefficients of the flavour region of the scale `t` (a number, or an
+        array, in which case each coefficient is an array)."""
+        if isinstance(t, np.ndarray):
+            index = np.zeros(t.shape, dtype=int)
+            for (t_min, *_) in self._regions[:-1]:
+                index += t < t_min
+            return self._region_arrays[:, index]
+        for region in self._regions:
+            if t >= region[0]:
+                return region
+        return self._regions[-1]
+
     def as0(self, t):
-        if t >= self.mb2:
-            t_ref = self.mz2
-            alpha_ref = self.at_sqr_mz
-            b0 = self.beta0(5)/(2.*pi)
-        elif t >= self.mc2:
-            t_ref = self.mb2
-            alpha_ref = self.at_sqr_mb
-            b0 = self.beta0(4)/(2.*pi)
-        else:
-            t_ref = self.mc2
-            alpha_ref = self.at_sqr_mc
-            b0 = self.beta0(3)/(2.*pi)
-        return 1./(1./alpha_ref+b0*log(t/t_ref))
+        _, t_ref, _, inv_alpha_ref, b0, _, _ = self.region(t)
+        log = np.log if isinstance(t, np.ndarray) else m.log
+        return 1./(inv_alpha_ref+b0*log(t/t_ref))
 
     def as1(self, t):
-        if t >= self.mb2:
-            t_ref = self.mz2
-            alpha_ref = self.at_sqr_mz
-            b0 = self.beta0(5)/(2.*pi)
-            b1 = self.beta1(5)/pow(2.*pi, 2)
-        elif t >= self.mc2:
-            t_ref = self.mb2
-            alpha_ref = self.at_sqr_mb
-            b0 = self.beta0(4)/(2.*pi)
-            b1 = self.beta1(4)/pow(2.*pi, 2)
-        else:
-            t_ref = self.mc2
-            alpha_ref = self.at_sqr_mc
-            b0 = self.beta0(3)/(2.*pi)
-            b1 = self.beta1(3)/pow(2.*pi, 2)
-        w = 1. + b0 * alpha_ref * log(t/t_ref)
-        return alpha_ref/w*(1.-b1/b0*alpha_ref*log(w)/w)
+        _, t_ref, alpha_ref, _, _, b0_alpha_ref, b1_b0_alpha_ref = self.region(t)
+        log = np.log if isinstance(t, np.ndarray) else m.log
+        w = 1. + b0_alpha_ref * log(t/t_ref)
+        return alpha_ref/w*(1.-b1_b0_alpha_ref*log(w)/w)
 
     def __call__(self, t):
+        if isinstance(t, (list, tuple)):
+            t = np.asarray(t, dtype=float)
         if self.order == 0:
             return self.as0(t)
         return self.as1(t)
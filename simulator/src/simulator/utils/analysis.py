@@ -4,6 +4,8 @@ import numpy as np
 # from utils.vector import Vec4
 # from utils.particle import Particle
 from .histogram import Histo1D, Scatter2D
+from .event_validator import event_arrays
+from .particle import EventRecord
 
 
 class Analysis:
@@ -16,43 +18,91 @@ class Analysis:
     scatter data.
     """
 
-    def __init__(self):
+    def __init__(self, num_variations=0):
+        """Initializes the histograms, plus one more set of histograms for each
+        of the `num_variations` weight variations (e.g. of the strong coupling
+        in the shower, see Shower)."""
 
         self.num_events = 0.
 
         # Construct list of histograms for the differential jet rates up to
         # y_{n_max,n_max+1} and for the corresponding integrated jet rates.
-        n_bins = 100
+        self.n_bins = 100
         self.left_edge = -4.3
         self.right_edge = -0.3
-        n_max = 4
-        self.y_n = [
-            Histo1D(n_bins, self.left_edge, self.right_edge, '/LL_JetRates/log10_y_{0}{1}'.format(i + 2, i + 3))
-            for i in range(n_max)]
-        self.y_n_integrated = [
-            Scatter2D(n_bins, self.left_edge, self.right_edge, '/LL_JetRates/integ_log10_y_{0}'.format(i + 2))
-            for i in range(n_max + 1)]
-
-    def analyze(self, event, weight):
-        """Adds a single event (= list of Particle instances)
-        with corresponding Monte-Carlo weight to the histograms."""
+        self.n_max = 4
+        self.y_n, self.y_n_integrated = self.makeHistograms()
+        self.variations = [self.makeHistograms() for _ in range(num_variations)]
+
+    def makeHistograms(self):
+        y_n = [
+            Histo1D(self.n_bins, self.left_edge, self.right_edge, '/LL_JetRates/log10_y_{0}{1}'.format(i + 2, i + 3))
+            for i in range(self.n_max)]
+        y_n_integrated = [
+            Scatter2D(self.n_bins, self.left_edge, self.right_edge, '/LL_JetRates/integ_log10_y_{0}'.format(i + 2))
+            for i in range(self.n_max + 1)]
+        return y_n, y_n_integrated
+
+    def analyze(self, event, weight, variation_weights=()):
+        """Adds a single event (= list of Particle instances, or EventRecord)
+        with corresponding Monte-Carlo weight to the histograms. The histograms
+        of each variation are filled with the weight multiplied by the
+        corresponding factor in `variation_weights`."""
 
         self.num_events += 1.
+        weight = float(weight)  # Accumulate in double precision, also for single-precision weights.
+
+        # The event is clustered once, for all the variations.
+        y_ij_list = self.cluster(event)
+        self.fill(y_ij_list, weight, self.y_n, self.y_n_integrated)
+        for ((y_n, y_n_integrated), factor) in zip(self.variations, variation_weights):
+            self.fill(y_ij_list, weight * factor, y_n, y_n_integrated)
+
+    def analyzeBatch(self, events, weights, variation_weights=None):
+        """Adds many events (= lists of Particle instances, or EventRecord
+        instances) with corresponding Monte-Carlo weights to the histograms,
+        clustering all of them at once. `variation_weights` is an array with
+        the factors of each variation (one column per variation) for each event.
+
+        The histograms are filled as by `analyze`, up to rounding (the weights
+        are summed in another order)."""
+        if len(events) == 0:
+            return
+        momenta, _, offsets = event_arrays(events)
+        self.analyzeArrays(momenta, offsets, weights, variation_weights)
+
+    def analyzeArrays(self, momenta, offsets, weights, variation_weights=None):
+        """Adds many events given by the four-momenta of all their particles
+        (an array of shape (N, 4), whose first two particles in each event are
+        the incoming ones) and the offsets of the events in it (length n + 1),
+        e.g. an EventChunk, as in analyzeBatch."""
+        weights = np.asarray(weights, dtype=float)
+        self.num_events += len(weights)
+
+        # The events are clustered once, for all the variations.
+        splitting_scales = self.clusterBatch(*pad_events(momenta, offsets))
+        self.fillBatch(splitting_scales, weights, self.y_n, self.y_n_integrated)
+        if variation_weights is not None and np.size(variation_weights) > 0:
+            variation_weights = np.asarray(variation_weights, dtype=float).reshape(len(weights), -1)
+            for ((y_n, y_n_integrated), factors) in zip(self.variations, variation_weights.T):
+                self.fillBatch(splitting_scales, weights * factors, y_n, y_n_integrated)
+
+    def fill(self, y_ij_list, weight, y_n, y_n_integrated):
+        """Fills a set of histograms with the splitting scales of an event."""
 
         # Fill differential j -> (j+1) splitting scale distributions if there
         # have not been a sufficient number of to cluster, we add the event to
         # the underflow of the histogram.
-        y_ij_list = self.cluster(event)
-        for j in range(len(self.y_n)):
+        for j in range(len(y_n)):
             log_y = self.left_edge - 1
             if len(y_ij_list) > j:
                 log_y = m.log10(y_ij_list[-1 - j])
-            self.y_n[j].fill(log_y, weight)
+            y_n[j].fill(log_y, weight)
 
         # Fill integrated j-jet rates.
         previous_logy = 1e20
-        for j in range(len(self.y_n_integrated) - 1):
-            j_jet_rate = self.y_n_integrated[j]
+        for j in range(len(y_n_integrated) - 1):
+            j_jet_rate = y_n_integrated[j]
             log_y = self.left_edge - 1
             if len(y_ij_list) > j:
                 log_y = m.log10(y_ij_list[-1 - j])
@@ -60,25 +110,54 @@ class Analysis:
                 if log_y < p.x < previous_logy:
                     p.y += weight
             previous_logy = log_y
-        for p in self.y_n_integrated[-1].points:
+        for p in y_n_integrated[-1].points:
             if p.x < previous_logy:
                 p.y += weight
 
+    def fillBatch(self, splitting_scales, weights, y_n, y_n_integrated):
+        """Fills a set of histograms with the splitting scales of many events, as
+        returned by clusterBatch, as `fill` does for each event."""
+        with np.errstate(divide='ignore'):
+            log_y = np.where(np.isnan(splitting_scales), self.left_edge - 1,
+                             np.log10(np.nan_to_num(splitting_scales, nan=1.)))
+
+        # Fill differential j -> (j+1) splitting scale distributions.
+        for j in range(len(y_n)):
+            y_n[j].fillArray(log_y[:, j], weights)
+
+        # Fill integrated j-jet rates.
+        previous_logy = np.full(len(weights), 1e20)
+        for j in range(len(y_n_integrated)):
+            x = np.array([p.x for p in y_n_integrated[j].points])
+            inside = x < previous_logy[:, None]
+            if j < len(y_n_integrated) - 1:
+                inside &= log_y[:, j, None] < x
+                previous_logy = log_y[:, j]
+            for (p, w) in zip(y_n_integrated[j].points, (weights @ inside).tolist()):
+                p.y += w
+
     def finalize(self, file_name):
         """Scales the histograms properly and writes them out as a YODA file
-        with the given file_name."""
+        with the given file_name. The histograms of the k-th variation are
+        written to the file file_name + "_variation{k}"."""
+
+        self.write(file_name, self.y_n, self.y_n_integrated)
+        for (k, (y_n, y_n_integrated)) in enumerate(self.variations):
+            self.write(file_name + "_variation{0}".format(k), y_n, y_n_integrated)
+
+    def write(self, file_name, y_n, y_n_integrated):
 
         # Divide out the number of events to get the correct cross-section.
-        for h in self.y_n:
+        for h in y_n:
             h.scale(1. / self.num_events)
-        for s in self.y_n_integrated:
+        for s in y_n_integrated:
             s.scale(1. / self.num_events)
 
         # Write the histograms to a YODA file.
         file = open(file_name + ".yoda", "w")
-        file.write("\n\n".join([str(h) for h in self.y_n]))
+        file.write("\n\n".join([str(h) for h in y_n]))
         file.write("\n\n")
-        file.write("\n\n".join([str(s) for s in self.y_n_integrated]))
+        file.write("\n\n".join([str(s) for s in y_n_integrated]))
         file.close()
 
     @staticmethod
@@ -89,53 +168,97 @@ class Analysis:
         cos_theta = min(max(pipj / m.sqrt(p_i.length_3d_squared() * p_j.length_3d_squared()), -1.0), 1.0)
         return 2.0 * min(p_i.E ** 2, p_j.E ** 2) * (1.0 - cos_theta) / q2
 
+    @staticmethod
+    def y_ij_array(p_i, e2_i, p_j, e2_j, q2):
+        """Calculates the k_T-algorithm distance measures between the four
+        momenta in the arrays p_i and p_j (of shapes broadcasting to (..., 4)),
+        with squared energies e2_i and e2_j, with the same arithmetic as y_ij.
+        The squared energies are computed as E ** 2 beforehand, since NumPy
+        squares by multiplication, which can differ in the last bit."""
+        pipj = p_i[..., 1] * p_j[..., 1] + p_i[..., 2] * p_j[..., 2] + p_i[..., 3] * p_j[..., 3]
+        l2_i = p_i[..., 1] * p_i[..., 1] + p_i[..., 2] * p_i[..., 2] + p_i[..., 3] * p_i[..., 3]
+        l2_j = p_j[..., 1] * p_j[..., 1] + p_j[..., 2] * p_j[..., 2] + p_j[..., 3] * p_j[..., 3]
+        cos_theta = np.minimum(np.maximum(pipj / np.sqrt(l2_i * l2_j), -1.0), 1.0)
+        return 2.0 * np.minimum(e2_i, e2_j) * (1.0 - cos_theta) / q2
+
     def cluster(self, event):
-        """Applies the k_T clustering algorithm to an event (= list of
-        Particle instances). A y_cut is not used, i.e. the clustering continues
-        until only two jets are left.
+        """Applies the k_T (Durham) clustering algorithm to an event (= list of
+        Particle instances, or EventRecord). A y_cut is not used, i.e. the
+        clustering continues until only two jets are left.
+
+        The distances of all pairs of particles are computed once, with array
+        operations, and each particle keeps its nearest neighbour among the
+        particles after it. After each recombination, only the distances to the
+        merged particle are computed, and only the nearest neighbours of the
+        particles which were paired with one of the recombined particles are
+        searched again. This takes O(N^2) operations per event, instead of
+        O(N^3) when recomputing all the distances at every step.
 
         Returns a list of splitting scales y_ij, ordered from smallest y_ij to
         largest y_ij.
         """
-        # TODO: Implement the k_T clustering algorithm described in
-        #  the lecture here, and return all found splitting scales y_ij as a
-        #  list, ordered from smallest y_ij to largest y_ij.
-
-        # NOTE: The y_ij distance measure is already implemented, see above.
-        # As a reference scale Q^2, use the invariant mass of two incoming (or
-        # two outgoing) particles, which in our case equals the squared Z mass.
-
-        # Setting the reference scale Q^2 as the invariant mass of the incoming particles.
-        p1, p2 = [event[k].mom for k in range(2)]
-        q2 = (p1 + p2).invariant_mass_squared()
-
-        # Get the momenta of the final-state particles after showering.
-        out_particles = event[2:]
-        num_particles = len(out_particles)
-        out_momenta = [particle.mom for particle in out_particles]
+        # As a reference scale Q^2, use the invariant mass of the two incoming
+        # particles, which in our case equals the squared Z mass.
+        if isinstance(event, EventRecord):
+            momenta = event.momenta().to_vec4s()
+            out_array = event.mom[2:event.size]
+        else:
+            momenta = [particle.mom for particle in event]
+            out_array = np.array([[p.E, p.px, p.py, p.pz] for p in momenta[2:]]).reshape(-1, 4)
+        q2 = momenta[0].pair_mass_squared(momenta[1])
+
+        # Momenta of the final-state particles after showering.
+        out_momenta = momenta[2:]
+        num_particles = len(out_momenta)
+        if num_particles <= 2:
+            return []
+
+        # N particles have N(N-1)/2 distances. Each recombination leads from N to
+        # N-1, so N-2 recombinations are needed to reach two jets. The merged
+        # particles are stored after the original ones, so that the particles
+        # are always ordered by the step at which they appeared, and ties in the
+        # distances are resolved in the same order as by scanning all the pairs.
+        num_slots = 2 * num_particles - 2
+        e2 = np.array([p.E ** 2 for p in out_momenta])
+        distances = self.y_ij_array(out_array[:, None], e2[:, None], out_array[None, :], e2[None, :], q2)
+        distances[np.tril_indices(num_particles)] = np.inf  # Only the distances to later particles are used.
+        padding = [m.inf] * (num_slots - num_particles)
+        distances = [row + padding for row in distances.tolist()]
+
+        # Nearest neighbour of each particle among the ones after it.
+        neighbour_distances = [min(row) for row in distances] + padding
+        neighbours = [row.index(d) for (row, d) in zip(distances, neighbour_distances)] + [0] * len(padding)
+        active = list(range(num_particles))
 
         splitting_scales = []
-
-        # TODO: Start by creating a naive (stupid) implementation,
-        #  check the results, and then come back to do it right.
-
-        for k in range(num_particles - 2):
-            # Compute the distance measures.
-            y_distances = [self.y_ij(out_momenta[i], out_momenta[j], q2)
-                           for i in range(num_particles - k - 1) for j in range(i+1, num_particles - k)]
-            ij_values = [(i, j) for i in range(num_particles - 1 - k) for j in range(i+1, num_particles - k)]
-
+        for new in range(num_particles, num_slots):
             # Find the minimum and append it.
-            min_id = np.argmin(y_distances)
-            splitting_scales.append(y_distances[min_id])
-
-            # Sum the momenta of the two particles giving the min. distance.
-            i, j = ij_values[min_id]
-            new_momentum = out_momenta[i] + out_momenta[j]
-
-            # Re-do the list of outgoing momenta.
-            out_momenta = [mom for (k, mom) in enumerate(out_momenta) if k != i and k != j]
-            out_momenta.append(new_momentum)
+            y_min = min(neighbour_distances)
+            i = neighbour_distances.index(y_min)
+            j = neighbours[i]
+            splitting_scales.append(y_min)
+
+            # Remove the particles i and j, and add their sum as a new particle.
+            active.remove(i)
+            active.remove(j)
+            neighbour_distances[i] = neighbour_distances[j] = m.inf
+            out_momenta.append(out_momenta[i] + out_momenta[j])
+            distances.append([m.inf] * num_slots)
+
+            # Compute the distances to the new particle, and update the nearest
+            # neighbours. The new particle comes after all the others, so it only
+            # replaces strictly larger distances.
+            for k in active:
+                row = distances[k]
+                row[i] = row[j] = m.inf
+                row[new] = y = self.y_ij(out_momenta[k], out_momenta[new], q2)
+                if neighbours[k] == i or neighbours[k] == j:
+                    neighbour_distances[k] = min(row[k + 1:])
+                    neighbours[k] = row.index(neighbour_distances[k], k + 1)
+                elif y < neighbour_distances[k]:
+                    neighbour_distances[k] = y
+                    neighbours[k] = new
+            active.append(new)
 
         splitting_scales.sort()  # Sort the list from smallest to largest.
 
@@ -145,14 +268,134 @@ class Analysis:
         # is a sort of integrated version of what we'd like to plot). Instead,
         # keep clustering until only two jets are left.
 
-        # N particles have N(N-1)/2 distances. Each splitting leads from N to N-1.
-        # In order to reach distances = 1, we require N - 2 splittings.
+        return splitting_scales
 
-        # TODO:
-        #  1. Start by computing all distance measures. How to arrange them?
-        #  2. Find the minimum, append it to the list.
-        #  3. Remove all the distance measures related to i and j.
-        #  4. Sum momenta of particles i and j into particle k.
-        #  5. Compute the distances of the remaining particles to particle k.
+    def clusterBatch(self, momenta, multiplicities, q2, max_elements=4_000_000):
+        """Applies the k_T (Durham) clustering algorithm to many events at once,
+        given the four-momenta of their final-state particles in an array of
+        shape (n_events, N, 4), padded with arbitrary values after the
+        `multiplicities` of each event, and their reference scales Q^2 `q2` (a
+        number or an array).
+
+        The recombinations of all the events proceed in parallel, with the same
+        steps as `cluster`, with masked array operations. The events are
+        clustered in groups of similar multiplicity, with at most `max_elements`
+        distances in memory at once.
+
+        Returns an array of shape (n_events, n_max + 1), whose column j holds
+        the (j+1)-th largest splitting scale y_ij of each event (the element
+        -1-j of the list of `cluster`), or NaN if the event has fewer.
+        """
+        momenta = np.asarray(momenta, dtype=float)
+        multiplicities = np.asarray(multiplicities, dtype=int)
+        q2 = np.broadcast_to(np.asarray(q2, dtype=float), multiplicities.shape)
+        splitting_scales = np.full((len(multiplicities), self.n_max + 1), np.nan)
+
+        # Group the events by multiplicity, to pad them as little as possible.
+        order = np.argsort(multiplicities, kind='stable')
+        num_slots = np.maximum(2 * multiplicities[order] - 2, 1)
+        begin = 0
+        while begin < len(order):
+            sizes = np.arange(1, len(order) - begin + 1) * num_slots[begin:] ** 2
+            end = begin + max(1, int(np.searchsorted(sizes, max_elements, side='right')))
+            group = order[begin:end]
+            n = multiplicities[group].max()
+            splitting_scales[group] = self._clusterPadded(momenta[group, :n], multiplicities[group], q2[group])
+            begin = end
 
         return splitting_scales
+
+    def _clusterPadded(self, momenta, multiplicities, q2):
+        """Clusters a group of events, padded to the largest multiplicity, for
+        clusterBatch."""
+        num_events, num_particles = momenta.shape[:2]
+        result = np.full((num_events, self.n_max + 1), np.nan)
+        if num_particles <= 2:
+            return result
+
+        # Particles (and merged particles) of each event, as in `cluster`.
+        num_slots = 2 * num_particles - 2
+        valid = np.arange(num_particles) < multiplicities[:, None]
+        out_momenta = np.zeros((num_events, num_slots, 4))
+        out_momenta[:, :num_particles] = momenta
+        e2 = np.zeros((num_events, num_slots))
+        e2[:, :num_particles][valid] = [E ** 2 for E in momenta[..., 0][valid].tolist()]
+
+        distances = np.full((num_events, num_slots, num_slots), np.inf)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            distances[:, :num_particles, :num_particles] = self.y_ij_array(
+                out_momenta[:, :num_particles, None], e2[:, :num_particles, None],
+                out_momenta[:, None, :num_particles], e2[:, None, :num_particles], q2[:, None, None])
+        valid_pairs = valid[:, :, None] & valid[:, None, :] & (np.arange(num_particles)[:, None]
+                                                               < np.arange(num_particles)[None, :])
+        distances[:, :num_particles, :num_particles][~valid_pairs] = np.inf
+
+        # Nearest neighbour of each particle among the ones after it.
+        neighbours = np.argmin(distances, axis=2)
+        neighbour_distances = np.take_along_axis(distances, neighbours[..., None], axis=2)[..., 0]
+        active = np.zeros((num_events, num_slots), dtype=bool)
+        active[:, :num_particles] = valid
+
+        scales = np.full((num_events, num_particles - 2), -np.inf)
+        for step in range(num_particles - 2):
+            # Events still clustering, and their pair of particles at minimum distance.
+            b = np.flatnonzero(multiplicities - 2 > step)
+            i = np.argmin(neighbour_distances[b], axis=1)
+            j = neighbours[b, i]
+            scales[b, step] = neighbour_distances[b, i]
+            new = multiplicities[b] + step
+
+            # Remove the particles i and j, and add their sum as a new particle.
+            active[b, i] = active[b, j] = False
+            distances[b, :, i] = distances[b, :, j] = np.inf
+            neighbour_distances[b, i] = neighbour_distances[b, j] = np.inf
+            out_momenta[b, new] = out_momenta[b, i] + out_momenta[b, j]
+            e2[b, new] = [E ** 2 for E in out_momenta[b, new, 0].tolist()]
+
+            # Compute the distances to the new particles, and update the nearest neighbours.
+            others = active[b]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                y = self.y_ij_array(out_momenta[b], e2[b], out_momenta[b, new, None], e2[b, new, None],
+                                    q2[b, None])
+            y[~others] = np.inf
+            distances[b, :, new] = y
+            active[b, new] = True
+
+            stale = others & ((neighbours[b] == i[:, None]) | (neighbours[b] == j[:, None]))
+            closer = others & ~stale & (y < neighbour_distances[b])
+            rows, k = np.nonzero(closer)
+            neighbours[b[rows], k] = new[rows]
+            neighbour_distances[b[rows], k] = y[rows, k]
+            rows, k = np.nonzero(stale)
+            row_distances = distances[b[rows], k]
+            neighbours[b[rows], k] = np.argmin(row_distances, axis=1)
+            neighbour_distances[b[rows], k] = row_distances[np.arange(len(rows)), neighbours[b[rows], k]]
+
+        # The largest splitting scales, from largest to smallest.
+        largest = -np.sort(-scales, axis=1)[:, :self.n_max + 1]
+        result[:, :largest.shape[1]] = np.where(np.isinf(largest), np.nan, largest)
+        return result
+
+
+def pad_events(momenta, offsets, num_incoming=2):
+    """Converts the four-momenta of the particles of many events (an array of
+    shape (N, 4), with the offsets of the events in it) into an array of the
+    final-state momenta of each event, padded with zeros to the largest
+    multiplicity, as used by Analysis.clusterBatch. The first two incoming
+    particles of each event define its reference scale Q^2.
+
+    Returns the padded momenta, the multiplicities and the reference scales."""
+    momenta = np.asarray(momenta, dtype=float)
+    offsets = np.asarray(offsets)
+    multiplicities = np.diff(offsets) - num_incoming
+    num_events = len(multiplicities)
+
+    # Q^2 as the invariant mass of the first two particles, as in `cluster`.
+    p = momenta[offsets[:-1]] + momenta[offsets[:-1] + 1]
+    q2 = p[:, 0] * p[:, 0] - p[:, 1] * p[:, 1] - p[:, 2] * p[:, 2] - p[:, 3] * p[:, 3]
+
+    padded = np.zeros((num_events, max(int(multiplicities.max(initial=0)), 0), 4))
+    events = np.repeat(np.arange(num_events), multiplicities)
+    positions = np.arange(len(events)) - np.repeat(np.cumsum(multiplicities) - multiplicities, multiplicities)
+    padded[events, positions] = momenta[np.repeat(offsets[:-1] + num_incoming, multiplicities) + positions]
+    return padded, multiplicities, q2
@@ -0,0 +1,300 @@
+import numpy as np
+
+from .particle import EventRecord, Particle
+from .vector import Vec4
+from .vector_array import Vec4Array
+from .qcd_group_constants import *
+
+
+# Kernel slots of each dipole: slot 0 is the soft kernel of the splitter (Pqq for quarks, Pgg for gluons),
+# and slot fl = 1, ..., 5 is the g->qq splitting Pgq into a quark of flavour fl (gluons only).
+N_KERNEL_SLOTS = 6
+
+
+def make_kinematics(z, y, phi, p_ij_t, pkt):
+    """Vectorized version of `Shower.make_kinematics` for arrays of splittings, with
+    momenta of shape (n, 4). Returns the arrays of momenta of both daughters and of
+    the spectator."""
+    p_ij_t, pkt = Vec4Array(p_ij_t), Vec4Array(pkt)
+    Q = p_ij_t + pkt
+    rkt = np.sqrt(Q.invariant_mass_squared()*y*z*(1.-z))
+    kt1 = p_ij_t.cross_product(pkt)
+    collinear = kt1.length_3d() < 1.e-6
+    if np.any(collinear):
+        kt1[collinear] = p_ij_t[collinear].cross_product(Vec4(0., 1., 0., 0.))
+    kt1 = kt1 * (rkt*np.cos(phi)/kt1.length_3d())
+    kt2cms = Q.boost(p_ij_t).cross_product(kt1)
+    kt2cms = kt2cms * (rkt*np.sin(phi)/kt2cms.length_3d())
+    kt2 = Q.boost_back(kt2cms)
+    p_i = z * p_ij_t + (1. - z) * y * pkt + kt1 + kt2
+    p_j = (1.-z) * p_ij_t + z * y * pkt - kt1 - kt2
+    p_k = (1.-y)*pkt
+    return p_i.array, p_j.array, p_k.array
+
+
+class BatchShower:
+    """
+    A vectorized version of the `Shower` cascade simulator, which evolves many events at once.
+
+    The events are stored as arrays (struct-of-arrays): particle numbers `pid` of shape
+    (events, capacity), momenta `mom` (events, capacity, 4), colors `col` (events, capacity, 2),
+    and the number of particles `n` of each event, where the first two particles are the
+    incoming ones. At each step, one trial emission is generated for every event still above
+    the cut-off scale `t0`, and the veto algorithm is applied to all of them at once.
+
+    The trial scale of each event is drawn from the sum of the overestimates of all its
+    splittings, and the splitting is then picked with probability proportional to its
+    overestimate. This generates the same distribution as the competition between
+    splittings in `Shower`, so the emission statistics are the same, although the
+    individual events differ.
+
+    Unlike `Shower`, the batch shower does not compute weights for alternative strong
+    couplings: use `Shower` or `ParallelShower` with `alphas_variations` for these.
+
+    The states of the random number generator at the start of the batches of the last call
+    to `run` are stored in `batch_states`, so that a batch can be showered again by setting
+    `rng.bit_generator.state` to its state.
+    """
+    def __init__(self, alphas, t0=1.0, batch_size=10_000, seed=42):
+        """Initializes the shower given a AlphaS strong coupling instance `alphas` (or any
+        coupling accepting arrays of scales), a lower cut-off scale `t0`, the number of events
+        evolved at once `batch_size`, and the `seed` of the random number generator."""
+        self.t0 = t0
+        self.alphas = alphas
+        self.alphas_max = alphas(self.t0)
+        self.batch_size = batch_size
+        self.rng = np.random.default_rng(seed=seed)
+        self.batch_states = []
+
+    @staticmethod
+    def to_arrays(events, extra_capacity=16):
+        """Converts a list of events (= lists of Particle instances, or EventRecord
+        instances) into arrays of particle numbers, momenta, colors and number of
+        particles."""
+        n = np.array([len(event) for event in events], dtype=int)
+        capacity = n.max(initial=2) + extra_capacity
+        pid = np.zeros((len(events), capacity), dtype=int)
+        mom = np.zeros((len(events), capacity, 4))
+        col = np.zeros((len(events), capacity, 2), dtype=int)
+        for (e, event) in enumerate(events):
+            for (i, particle) in enumerate(event):
+                pid[e, i] = particle.pid
+                mom[e, i] = [particle.mom.E, particle.mom.px, particle.mom.py, particle.mom.pz]
+                col[e, i] = particle.color
+        return pid, mom, col, n
+
+    @staticmethod
+    def from_arrays(events, pid, mom, col, n):
+        """Writes the arrays of a showered batch back into the list of events
+        (= lists of Particle instances, or EventRecord instances), modifying them
+        in-place."""
+        for (e, event) in enumerate(events):
+            for i in range(n[e]):
+                momentum = Vec4(*mom[e, i].tolist())
+                color = col[e, i].tolist()
+                if i < len(event):
+                    event[i].set(int(pid[e, i]), momentum, color)
+                elif isinstance(event, EventRecord):
+                    event.append(int(pid[e, i]), momentum, color)
+                else:
+                    event.append(Particle(int(pid[e, i]), momentum, color))
+
+    def run(self, events, t):
+        """Runs the shower on a list of events (= lists of Particle instances, or EventRecord
+        instances), starting from the scale `t` (a number, or one value per event). The events
+        are evolved in batches of `batch_size` and modified in-place."""
+        t_values = np.broadcast_to(np.asarray(t, dtype=float), (len(events),))
+        self.batch_states = []
+        for start in range(0, len(events), self.batch_size):
+            self.batch_states.append(self.rng.bit_generator.state)
+            batch = events[start:start + self.batch_size]
+            arrays = self.to_arrays(batch)
+            arrays = self.evolve(*arrays, t_values[start:start + len(batch)])
+            self.from_arrays(batch, *arrays)
+
+    def evolve(self, pid, mom, col, n, t):
+        """Runs the shower on a batch of events given as arrays (see the class description),
+        starting from the scales `t`. Returns the arrays `pid`, `mom`, `col` and `n` of the
+        showered events, whose capacity grows as needed."""
+        pid = np.array(pid, dtype=int)
+        mom = np.array(mom, dtype=float)
+        col = np.array(col, dtype=int)
+        n = np.array(n, dtype=int)
+        t = np.array(np.broadcast_to(t, n.shape), dtype=float)
+        num_events, capacity = pid.shape
+
+        color_index = np.ones(num_events, dtype=int)
+
+        # Cached dipoles: spectator index, invariant mass, upper z limit and overestimates of each kernel slot,
+        # for each particle as splitter and each of its two color partners. The cumulative sums of the
+        # overestimates over the particles of each event are also cached, to pick the splitter first.
+        spect = np.zeros((num_events, capacity, 2), dtype=int)
+        m2 = np.zeros((num_events, capacity, 2))
+        zp = np.zeros((num_events, capacity, 2))
+        g = np.zeros((num_events, capacity, 2, N_KERNEL_SLOTS))
+        g_cumulative = np.zeros((num_events, capacity))
+
+        active = t > self.t0
+        refresh = np.flatnonzero(active)
+
+        while True:
+            if refresh.size > 0:
+                spect[refresh], m2[refresh], zp[refresh], g[refresh] = self._dipoles(pid, mom, col, n, refresh)
+                g_cumulative[refresh] = np.cumsum(np.sum(g[refresh], axis=(2, 3)), axis=1)
+
+            events = np.flatnonzero(active)
+            if events.size == 0:
+                break
+
+            # Trial scale from the sum of all overestimates of each event.
+            g_sums = g_cumulative[events, -1]
+            u = self.rng.random((5, events.size))
+            t_trial = np.zeros(events.size)
+            has_splittings = g_sums > 0.
+            t_trial[has_splittings] = t[events[has_splittings]] * \
+                u[0, has_splittings] ** (1. / g_sums[has_splittings])
+            t[events] = t_trial
+
+            # Events below the cut-off are finished.
+            above_cutoff = t_trial > self.t0
+            active[events[~above_cutoff]] = False
+            events, t_trial, g_sums = events[above_cutoff], t_trial[above_cutoff], g_sums[above_cutoff]
+            u = u[:, above_cutoff]
+
+            # Pick the splitting with probability proportional to its overestimate: first the splitter,
+            # and then the partner and kernel slot among those of the splitter.
+            target = u[1] * g_sums
+            cumulative = g_cumulative[events]
+            i = np.minimum(np.sum(cumulative <= target[:, None], axis=1), capacity - 1)
+            target -= np.where(i > 0, cumulative[np.arange(events.size), i - 1], 0.)
+            channels = np.cumsum(g[events, i].reshape(events.size, 2 * N_KERNEL_SLOTS), axis=1)
+            channel = np.minimum(np.sum(channels <= target[:, None], axis=1), channels.shape[1] - 1)
+            partner, slot = np.unravel_index(channel, (2, N_KERNEL_SLOTS))
+            k = spect[events, i, partner]
+            m2_values = m2[events, i, partner]
+            zp_values = zp[events, i, partner]
+            gluon = pid[events, i] == 21
+            soft = slot == 0
+
+            # Generate z and apply the veto algorithm.
+            z = np.where(soft,
+                         1. + (zp_values - 1.) * (zp_values / (1. - zp_values)) ** u[2],
+                         (1. - zp_values) + (2. * zp_values - 1.) * u[2])
+            y = t_trial / m2_values / z / (1. - z)
+            accepted = y < 1.
+
+            with np.errstate(divide='ignore', invalid='ignore'):
+                soft_term = 2. / (1. - z * (1. - y))
+                value = np.where(soft,
+                                 np.where(gluon, CA / 2. * (soft_term - 2. + z * (1. - z)),
+                                          CF * (soft_term - (1. + z))),
+                                 TR / 2. * (1. - 2. * z * (1. - z)))
+                estimate = np.where(soft, np.where(gluon, CA / (1. - z), CF * 2. / (1. - z)), TR / 2.)
+            ratio = np.zeros(events.size)
+            ratio[accepted] = (1. - y[accepted]) * self.alphas(t_trial[accepted]) * value[accepted] / \
+                (self.alphas_max * estimate[accepted])
+            accepted &= ratio > u[3]
+
+            refresh = events[accepted]
+            if refresh.size == 0:
+                continue
+
+            # Make room for the emitted particles.
+            if np.max(n[refresh]) >= capacity:
+                extra = capacity
+                pid = np.pad(pid, ((0, 0), (0, extra)))
+                mom = np.pad(mom, ((0, 0), (0, extra), (0, 0)))
+                col = np.pad(col, ((0, 0), (0, extra), (0, 0)))
+                spect = np.pad(spect, ((0, 0), (0, extra), (0, 0)))
+                m2 = np.pad(m2, ((0, 0), (0, extra), (0, 0)))
+                zp = np.pad(zp, ((0, 0), (0, extra), (0, 0)))
+                g = np.pad(g, ((0, 0), (0, extra), (0, 0), (0, 0)))
+                g_cumulative = np.pad(g_cumulative, ((0, 0), (0, extra)), mode="edge")
+                capacity += extra
+
+            self._emit(pid, mom, col, n, color_index, refresh, i[accepted], k[accepted], slot[accepted],
+                       z[accepted], y[accepted], 2. * np.pi * u[4, accepted])
+
+        return pid, mom, col, n
+
+    def _dipoles(self, pid, mom, col, n, events):
+        """Finds the color partners of each particle of the given events, and computes the
+        invariant masses, upper z limits and overestimates of the corresponding splittings."""
+        capacity = pid.shape[1]
+        indices = np.arange(capacity)
+        colors = col[events]
+
+        valid = (indices >= 2) & (indices < n[events][:, None])
+        pairs = valid[:, :, None] & valid[:, None, :] & (indices[:, None] != indices[None, :])
+        by_color = (colors[:, :, None, 0] > 0) & (colors[:, :, None, 0] == colors[:, None, :, 1]) & pairs
+        by_anticolor = (colors[:, :, None, 1] > 0) & (colors[:, :, None, 1] == colors[:, None, :, 0]) & pairs
+
+        spect = np.stack([np.argmax(by_color, axis=2), np.argmax(by_anticolor, axis=2)], axis=-1)
+        connected = np.stack([np.any(by_color, axis=2), np.any(by_anticolor, axis=2)], axis=-1)
+        # A spectator connected through both color and anti-color is a single dipole.
+        connected[..., 1] &= ~(connected[..., 0] & (spect[..., 0] == spect[..., 1]))
+
+        momenta = mom[events]
+        p_sum = momenta[:, :, None, :] + momenta[np.arange(events.size)[:, None, None], spect]
+        m2 = Vec4Array(p_sum).invariant_mass_squared()
+        connected &= m2 >= 4. * self.t0
+
+        zp = np.full(m2.shape, 0.5)
+        zp[connected] = .5 * (1. + np.sqrt(1. - 4. * self.t0 / m2[connected]))
+        log_ratio = np.log(zp / (1. - zp))
+
+        gluon = (pid[events] == 21)[:, :, None]
+        g = np.zeros(m2.shape + (N_KERNEL_SLOTS,))
+        g[..., 0] = np.where(gluon, CA * log_ratio, CF * 2. * log_ratio)
+        g[..., 1:] = np.where(gluon, TR / 2. * (2. * zp - 1.), 0.)[..., None]
+        g *= (self.alphas_max / (2. * np.pi)) * connected[..., None]
+
+        return spect, m2, zp, g
+
+    def _emit(self, pid, mom, col, n, color_index, events, i, k, slot, z, y, phi):
+        """Applies the accepted splittings of particles `i` with spectators `k` in the given
+        events, modifying the arrays in-place."""
+        j = n[events]  # Index of the emitted particle.
+        p_i, p_j, p_k = make_kinematics(z, y, phi, mom[events, i], mom[events, k])
+
+        color_index[events] += 1
+        c = color_index[events]
+        col_ij = col[events, i]
+        col_k = col[events, k]
+        pid_ij = pid[events, i]
+        gluon = pid_ij == 21
+
+        col_i = np.empty_like(col_ij)
+        col_j = np.empty_like(col_ij)
+        pid_i = pid_ij.copy()
+        pid_j = np.full_like(pid_ij, 21)
+
+        # q->qg splittings.
+        quark, antiquark = ~gluon & (pid_ij > 0), ~gluon & (pid_ij < 0)
+        col_i[quark] = np.stack([c[quark], np.zeros_like(c[quark])], axis=-1)
+        col_j[quark] = np.stack([col_ij[quark, 0], c[quark]], axis=-1)
+        col_i[antiquark] = np.stack([np.zeros_like(c[antiquark]), c[antiquark]], axis=-1)
+        col_j[antiquark] = np.stack([c[antiquark], col_ij[antiquark, 1]], axis=-1)
+
+        # g->gg splittings.
+        gg = gluon & (slot == 0)
+        flip = (col_ij[:, 0] == col_k[:, 1]) & \
+            ~((col_ij[:, 1] == col_k[:, 0]) & (self.rng.random(events.size) > 0.5))
+        first = gg & ~flip
+        col_i[first] = np.stack([col_ij[first, 0], c[first]], axis=-1)
+        col_j[first] = np.stack([c[first], col_ij[first, 1]], axis=-1)
+        second = gg & flip
+        col_i[second] = np.stack([c[second], col_ij[second, 1]], axis=-1)
+        col_j[second] = np.stack([col_ij[second, 0], c[second]], axis=-1)
+
+        # g->qq splittings.
+        gq = gluon & (slot > 0)
+        col_i[gq] = np.stack([col_ij[gq, 0], np.zeros_like(c[gq])], axis=-1)
+        col_j[gq] = np.stack([np.zeros_like(c[gq]), col_ij[gq, 1]], axis=-1)
+        pid_i[gq] = slot[gq]
+        pid_j[gq] = -slot[gq]
+
+        mom[events, i], mom[events, j], mom[events, k] = p_i, p_j, p_k
+        col[events, i], col[events, j] = col_i, col_j
+        pid[events, i], pid[events, j] = pid_i, pid_j
+        n[events] += 1
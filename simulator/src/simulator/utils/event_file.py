@@ -0,0 +1,164 @@
+import json
+from pathlib import Path
+from typing import NamedTuple
+
+import numpy as np
+
+from .particle import EventRecord
+
+
+FORMAT_VERSION = 1
+
+
+class EventChunk(NamedTuple):
+    """A chunk of stored events: the particle numbers `pid` (shape (N,)), momenta
+    `mom` (shape (N, 4)) and colors `col` (shape (N, 2)) of all their particles,
+    the `offsets` of the events in these arrays (length n + 1), and their
+    `weights` (shape (n,)) and `variation_weights` (shape (n, num_variations))."""
+    pid: np.ndarray
+    mom: np.ndarray
+    col: np.ndarray
+    offsets: np.ndarray
+    weights: np.ndarray
+    variation_weights: np.ndarray
+
+    def __len__(self):
+        return len(self.weights)
+
+    def record(self, i):
+        """The i-th event of the chunk, as an EventRecord wrapping the arrays of the chunk."""
+        begin, end = self.offsets[i], self.offsets[i + 1]
+        return EventRecord.from_arrays(self.pid[begin:end], self.mom[begin:end], self.col[begin:end])
+
+
+class EventWriter:
+    """
+    Writes showered events with their weights to the directory `path`, in chunks
+    of `chunk_size` events. Each chunk k is stored in the NumPy files
+    chunk{k}.{array}.npy, with the arrays of an EventChunk, and the file
+    events.json lists the sizes of the chunks written so far. The momenta are
+    stored in the lab frame.
+
+    Example usage, storing the events while showering them:
+
+      with EventWriter("data/events") as writer:
+          for event, weight in zip(events, weights):
+              shower.run(event, t=s)
+              writer.write(event, weight)
+
+    """
+
+    def __init__(self, path, chunk_size=100_000, num_variations=0):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.chunk_size = chunk_size
+        self.num_variations = num_variations
+        self.chunk_sizes = []
+        self._clearBuffers()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def _clearBuffers(self):
+        self._pid, self._mom, self._col, self._sizes = [], [], [], []
+        self._weights, self._variation_weights = [], []
+
+    def write(self, event, weight, variation_weights=()):
+        """Adds an event (= list of Particle instances, or EventRecord) with its
+        weight, and the factors of the `num_variations` weight variations."""
+        record = event if isinstance(event, EventRecord) else EventRecord.from_particles(event, extra_capacity=0)
+        self._pid.append(record.pid[:record.size])
+        self._mom.append(record.lab_momenta().array)
+        self._col.append(record.col[:record.size])
+        self._sizes.append(record.size)
+        self._weights.append(float(weight))
+        if len(variation_weights) != self.num_variations:
+            exit(f"Expected {self.num_variations} variation weights, got {len(variation_weights)}.")
+        self._variation_weights.append(variation_weights)
+        if len(self._sizes) == self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """Writes the buffered events as a new chunk."""
+        if not self._sizes:
+            return
+        offsets = np.zeros(len(self._sizes) + 1, dtype=np.int64)
+        np.cumsum(self._sizes, out=offsets[1:])
+        variation_weights = np.array(self._variation_weights, dtype=float).reshape(len(self._sizes),
+                                                                                  self.num_variations)
+        chunk = EventChunk(np.concatenate(self._pid).astype(np.int32), np.concatenate(self._mom),
+                           np.concatenate(self._col).astype(np.int32), offsets,
+                           np.array(self._weights), variation_weights)
+        k = len(self.chunk_sizes)
+        for (name, array) in chunk._asdict().items():
+            np.save(self.path / f"chunk{k}.{name}.npy", array)
+        self.chunk_sizes.append(len(chunk))
+        self._clearBuffers()
+
+        # The index is rewritten after every chunk, so that the events written so far can be read.
+        with open(self.path / "events.json", "w") as file:
+            json.dump({"format_version": FORMAT_VERSION, "num_variations": self.num_variations,
+                       "chunk_sizes": self.chunk_sizes}, file)
+
+    def close(self):
+        self.flush()
+
+
+class EventReader:
+    """
+    Reads the events written by an EventWriter to the directory `path`. With
+    `mmap` (the default), the arrays of the chunks are memory-mapped, so that
+    only the parts which are used are read from disk.
+
+    The events can be read one by one, as (EventRecord, weight, variation
+    weights) tuples, or as whole EventChunk instances with `chunks`.
+
+    Example usage, filling a new analysis with stored events:
+
+      analysis = EventReader("data/events").replay(Analysis())
+      analysis.finalize(file_name)
+
+    """
+
+    def __init__(self, path, mmap=True):
+        self.path = Path(path)
+        self.mmap_mode = "r" if mmap else None
+        with open(self.path / "events.json") as file:
+            index = json.load(file)
+        if index["format_version"] != FORMAT_VERSION:
+            exit(f"Event file format version {index['format_version']} not supported.")
+        self.num_variations = index["num_variations"]
+        self.chunk_sizes = index["chunk_sizes"]
+
+    def __len__(self):
+        return sum(self.chunk_sizes)
+
+    def chunk(self, k):
+        return EventChunk(*(np.load(self.path / f"chunk{k}.{name}.npy", mmap_mode=self.mmap_mode)
+                            for name in EventChunk._fields))
+
+    def chunks(self):
+        """Iterates over the chunks of events."""
+        return (self.chunk(k) for k in range(len(self.chunk_sizes)))
+
+    def __iter__(self):
+        for chunk in self.chunks():
+            weights = chunk.weights.tolist()
+            variation_weights = chunk.variation_weights.tolist()
+            for i in range(len(chunk)):
+                yield chunk.record(i), weights[i], variation_weights[i]
+
+    def replay(self, analysis, batched=True):
+        """Fills an Analysis instance with all the stored events, and returns it.
+        If `batched`, the events of each chunk are clustered at once (see
+        Analysis.analyzeArrays), otherwise one by one."""
+        if batched:
+            for chunk in self.chunks():
+                analysis.analyzeArrays(chunk.mom, chunk.offsets, chunk.weights, chunk.variation_weights)
+            return analysis
+        for (record, weight, variation_weights) in self:
+            analysis.analyze(record, weight, variation_weights)
+        return analysis
@@ -0,0 +1,141 @@
+from typing import NamedTuple
+
+import numpy as np
+
+from .particle import EventRecord
+
+
+class EventViolation(NamedTuple):
+    """A violation of momentum or color conservation, found by an EventValidator in
+    the event at position `index` of the run, showered with the random seed `seed`
+    (or any state of the random numbers from which the event can be showered again,
+    e.g. a seed and a UniformStream position)."""
+    index: int
+    seed: object
+    momentum_imbalance: tuple
+    color_conserved: bool
+
+
+def event_arrays(events):
+    """Concatenates the momenta (shape (N, 4)) and colors (shape (N, 2)) of the
+    particles of a list of events (= lists of Particle instances, or EventRecord
+    instances), and returns them with the offsets of the events (length n + 1)."""
+    momenta, colors, sizes = [], [], []
+    for event in events:
+        if isinstance(event, EventRecord):
+            momenta.append(event.mom[:event.size])
+            colors.append(event.col[:event.size])
+        else:
+            momenta.append(np.array([[p.mom.E, p.mom.px, p.mom.py, p.mom.pz] for p in event], dtype=float))
+            colors.append(np.array([p.color for p in event], dtype=int))
+        sizes.append(len(event))
+    offsets = np.zeros(len(sizes) + 1, dtype=int)
+    np.cumsum(sizes, out=offsets[1:])
+    return np.concatenate(momenta).reshape(-1, 4), np.concatenate(colors).reshape(-1, 2), offsets
+
+
+def conservation_checks(momenta, colors, offsets, num_incoming=2, tolerance=1.e-10):
+    """Checks momentum and color conservation of the events given by the arrays of
+    event_arrays, where the first `num_incoming` particles of each event are incoming.
+
+    Returns the momentum imbalance (outgoing minus incoming) of each event, and two
+    boolean arrays telling if momentum (up to `tolerance` times the incoming energy)
+    and color are conserved in each event."""
+    num_events = len(offsets) - 1
+    sizes = np.diff(offsets)
+    event_ids = np.repeat(np.arange(num_events), sizes)
+    incoming = (np.arange(len(momenta)) - offsets[event_ids]) < num_incoming
+
+    # Sums over the particles of each (non-empty) event.
+    signed_momenta = np.where(incoming[:, None], -momenta, momenta)
+    imbalance = np.add.reduceat(signed_momenta, offsets[:-1], axis=0)
+    energy_in = np.add.reduceat(np.where(incoming, momenta[:, 0], 0.), offsets[:-1])
+    momentum_ok = np.all(np.fabs(imbalance) <= tolerance * np.maximum(energy_in, 1.)[:, None], axis=1)
+
+    # Every color must be matched by an anti-color of the same event. The color of
+    # an incoming particle is an outgoing anti-color, and vice versa.
+    outgoing_colors = np.where(incoming, colors[:, 1], colors[:, 0])
+    outgoing_anticolors = np.where(incoming, colors[:, 0], colors[:, 1])
+    num_colors = int(colors.max(initial=0)) + 1
+    keys = np.concatenate((event_ids * num_colors + outgoing_colors, event_ids * num_colors + outgoing_anticolors))
+    signs = np.concatenate((np.ones(len(colors)), -np.ones(len(colors))))
+    connected = np.concatenate((outgoing_colors, outgoing_anticolors)) > 0
+    unique_keys, inverse = np.unique(keys[connected], return_inverse=True)
+    counts = np.bincount(inverse, weights=signs[connected], minlength=len(unique_keys))
+    color_ok = np.ones(num_events, dtype=bool)
+    color_ok[unique_keys[counts != 0] // num_colors] = False
+
+    return imbalance, momentum_ok, color_ok
+
+
+class EventValidator:
+    """
+    Checks momentum and color conservation of whole batches of showered events
+    with array operations, for a random fraction `fraction` of the events (all
+    of them by default), so that it can be left on in production runs.
+
+    The first `num_incoming` particles of each event are incoming, and momentum
+    is conserved up to `tolerance` times their total energy. The events are
+    selected with a random number generator seeded with `seed`, independent of
+    the one of the shower.
+
+    The violations found are stored in `violations`, as EventViolation instances
+    with the position of the event in the run (counting all the events passed to
+    `validate`) and the seed of the shower that produced it. If `strict` is true,
+    the program exits at the first batch with violations.
+
+    Example usage, checking 1% of the events:
+
+      validator = EventValidator(fraction=0.01)
+      shower.run(events, t=s)
+      validator.validate(events, seeds=shower_seed)
+      print(validator.summary())
+
+    """
+
+    def __init__(self, fraction=1., seed=None, num_incoming=2, tolerance=1.e-10, strict=False):
+        if not 0. <= fraction <= 1.:
+            exit(f"Fraction of validated events: {fraction} not in [0, 1].")
+        self.fraction = fraction
+        self.rng = np.random.default_rng(seed=seed)
+        self.num_incoming = num_incoming
+        self.tolerance = tolerance
+        self.strict = strict
+        self.num_events = 0
+        self.num_checked = 0
+        self.violations = []
+
+    def validate(self, events, seeds=None):
+        """Checks a randomly selected fraction of a batch of events (= lists of
+        Particle instances, or EventRecord instances). `seeds` is the seed of the
+        shower, or a list with the seed (or random number state) of each event.
+        Returns the violations found in this batch."""
+        first_index = self.num_events
+        self.num_events += len(events)
+        if self.fraction < 1.:
+            selected = np.flatnonzero(self.rng.random(len(events)) < self.fraction)
+        else:
+            selected = np.arange(len(events))
+        if len(selected) == 0:
+            return []
+        self.num_checked += len(selected)
+
+        arrays = event_arrays([events[i] for i in selected.tolist()])
+        imbalance, momentum_ok, color_ok = conservation_checks(*arrays, num_incoming=self.num_incoming,
+                                                               tolerance=self.tolerance)
+
+        violations = []
+        for k in np.flatnonzero(~(momentum_ok & color_ok)).tolist():
+            i = int(selected[k])
+            seed = seeds[i] if isinstance(seeds, list) else seeds
+            violations.append(EventViolation(first_index + i, seed, tuple(imbalance[k].tolist()),
+                                             bool(color_ok[k])))
+        self.violations += violations
+
+        if self.strict and violations:
+            exit("Conservation violated in events:\n" + "\n".join(str(violation) for violation in violations))
+        return violations
+
+    def summary(self):
+        return {"num_events": self.num_events, "num_checked": self.num_checked,
+                "num_violations": len(self.violations)}
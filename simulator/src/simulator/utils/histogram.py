@@ -1,7 +1,8 @@
-import sys
-
 """This file reimplements the relevant classes of the YODA histogramming
 framework."""
+import sys
+
+import numpy as np
 
 
 class Bin1D:
@@ -35,6 +36,15 @@ class Bin1D:
         self.wx2 += w * w * x
         self.n += 1.
 
+    def add(self, w, w2, wx, wx2, n):
+        """Add the sums of weights (and of their squares and products with x)
+        of n points."""
+        self.w += w
+        self.w2 += w2
+        self.wx += wx
+        self.wx2 += wx2
+        self.n += n
+
     def scale(self, factor):
         """Scale current weight by `factor`."""
         self.w *= factor
@@ -118,6 +128,25 @@ class Histo1D:
             self.bins[L].fill(x, w)
         self.total.fill(x, w)
 
+    def fillArray(self, x, w):
+        """Fill the points of weights w (an array, or a single weight) at the
+        x coordinates of an array, into the same bins as `fill`."""
+        x = np.asarray(x, dtype=float)
+        w = np.broadcast_to(np.asarray(w, dtype=float), x.shape)
+        n = len(self.bins)
+        xmins = np.array([b.xmin for b in self.bins])
+        # As in `fill`, the last bin is only filled at its lower edge, and x values
+        # above it go to the overflow.
+        index = np.minimum(np.searchsorted(xmins, x, side='right') - 1, n - 2)
+        index[x < xmins[0]] = n
+        index[x > xmins[-1]] = n + 1
+        sums = [np.bincount(index, weights=values, minlength=n + 2).tolist()
+                for values in (w, w * w, w * x, w * w * x, np.ones_like(w))]
+        for (k, b) in enumerate(self.bins + [self.uflow, self.oflow]):
+            if sums[4][k] > 0:
+                b.add(*(values[k] for values in sums))
+        self.total.add(*(sum(values) for values in sums))
+
     def scale(self, factor):
         """Scale histogram weights (i.e. bin heights) by `factor`."""
         self.total.scale(factor)
@@ -0,0 +1,105 @@
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+
+import numpy as np
+
+from .particle import EventRecord
+from .random_stream import UniformStream
+from .shower import Shower
+
+
+_worker_shower = None  # Shower of a worker process, kept between chunks.
+
+
+def _init_worker(alphas, t0, alphas_variations):
+    global _worker_shower
+    _worker_shower = Shower(alphas, t0=t0, alphas_variations=alphas_variations)
+
+
+def _run_chunk(records, t, seed):
+    """Showers a chunk of events (= EventRecord instances) in a worker process,
+    with a stream of random numbers seeded for this chunk. Returns the records
+    with the variation weights of each event."""
+    _worker_shower.rng = UniformStream(seed=seed)
+    variation_weights = []
+    for record in records:
+        _worker_shower.run(record, t)
+        variation_weights.append(_worker_shower.variation_weights)
+    return records, variation_weights
+
+
+class ParallelShower:
+    """
+    Runs the shower on chunks of events in a pool of worker processes.
+
+    Each chunk of `chunk_size` events is showered with its own random number
+    generator, seeded from a SeedSequence spawned from `seed`. The results are
+    collected in the order of the events, so that they are reproducible for a
+    fixed seed and chunk size, independently of the number of workers.
+
+    The workers (and their Shower instances) are kept between calls to `run`,
+    until `close` is called.
+
+    The weights of the events for the alternative strong couplings
+    `alphas_variations` (see Shower, which must be picklable, e.g. AlphaS
+    instances rather than lambdas) are stored after each call to `run` in
+    `variation_weights`, an array of shape (number of events, number of
+    variations).
+
+    If an EventValidator `validator` is given, the showered events of each call
+    to `run` are validated, with the SeedSequence of their chunk as seed.
+
+    Example usage, showering the events in-place on four processes:
+
+      with ParallelShower(alphas, n_workers=4) as shower:
+          shower.run(events, t=s)
+
+    """
+
+    def __init__(self, alphas, t0=1.0, seed=42, n_workers=None, chunk_size=1000, validator=None,
+                 alphas_variations=None):
+        """Initializes the pool of `n_workers` processes (by default, one per
+        core), each with a Shower of strong coupling `alphas`, cut-off scale
+        `t0` and coupling variations `alphas_variations`."""
+        self.t0 = t0
+        self.num_variations = len(alphas_variations) if alphas_variations is not None else 0
+        self.variation_weights = np.ones((0, self.num_variations))
+        self.chunk_size = chunk_size
+        self.seed_sequence = np.random.SeedSequence(seed)
+        self.validator = validator
+        self._pool = ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker,
+                                         initargs=(alphas, t0, alphas_variations))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def close(self):
+        self._pool.shutdown()
+
+    def run(self, events, t):
+        """Runs the shower on a list of events (= lists of Particle instances,
+        or EventRecord instances), starting from the scale `t`. The events are
+        modified in-place, as in Shower.run."""
+        records = [event if isinstance(event, EventRecord) else EventRecord.from_particles(event)
+                   for event in events]
+        chunks = [records[k:k + self.chunk_size] for k in range(0, len(records), self.chunk_size)]
+        seeds = self.seed_sequence.spawn(len(chunks))
+
+        # The results are returned in the order of the chunks.
+        results = list(self._pool.map(_run_chunk, chunks, [t] * len(chunks), seeds))
+        showered_chunks = [chunk for (chunk, _) in results]
+        variation_weights = [chunk_weights for (_, chunk_weights) in results]
+        self.variation_weights = np.array(list(chain.from_iterable(variation_weights)),
+                                          dtype=float).reshape(len(events), self.num_variations)
+
+        for (event, record) in zip(events, chain.from_iterable(showered_chunks)):
+            if isinstance(event, EventRecord):
+                event.pid, event.mom, event.col, event.size = record.pid, record.mom, record.col, record.size
+            else:
+                record.update_particles(event)
+
+        if self.validator is not None:
+            self.validator.validate(events, seeds=[seeds[k // self.chunk_size] for k in range(len(events))])
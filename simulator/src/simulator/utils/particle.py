@@ -1,11 +1,14 @@
-import math as m
+import numpy as np
 
 from .vector import Vec4
+from .vector_array import Vec4Array
 
 
 class Particle:
     """A simple particle class."""
 
+    __slots__ = ("pid", "mom", "color")
+
     def __init__(self, particle_num, momentum, color=None):
         """Initializes a particle given its particle number, a momentum, and a
         2-component list giving its color and its anti-color, where 0 stand for
@@ -29,26 +32,210 @@ class Particle:
         """Checks if this and some other particle are "color-connected",
         i.e. a color in one of the two particles must find a corresponding
         anti-color in the other of the two particles."""
-        return (self.color[0] > 0 and self.color[0] == other.color[1]) or \
-               (self.color[1] > 0 and self.color[1] == other.color[0])
+        return colors_connected(self.color, other.color)
+
+
+def colors_connected(color, other_color):
+    """Checks if two [color, anti-color] pairs are "color-connected"."""
+    return (color[0] > 0 and color[0] == other_color[1]) or \
+           (color[1] > 0 and color[1] == other_color[0])
+
+
+_SAME_ROTATION = object()  # Default rotation of EventRecord.copy, keeping the one of the record.
+
+
+class EventRecord:
+    """An event (= list of particles) stored in preallocated arrays, instead of as
+    Particle instances: particle numbers `pid`, momenta `mom` (E, px, py, pz) and
+    colors `col` (color, anti-color). Only the first `size` entries are filled, and
+    the capacity of the arrays is doubled whenever it is exceeded.
+
+    Indexing the record gives ParticleView instances, which behave like Particle
+    instances but read and write the arrays of the record.
+
+    The momenta may be stored in a frame rotated with respect to the lab frame
+    (e.g. with the initial quark along the z-axis), given by the 3x3 `rotation`
+    matrix from the frame of the record to the lab frame. Rotation-invariant
+    quantities can be computed without it, and it is only applied by
+    `lab_momenta`, `rotateToLab` and `to_particles`.
+    """
+
+    __slots__ = ("pid", "mom", "col", "size", "rotation")
+
+    def __init__(self, capacity=16, rotation=None):
+        self.pid = np.zeros(capacity, dtype=int)
+        self.mom = np.zeros((capacity, 4))
+        self.col = np.zeros((capacity, 2), dtype=int)
+        self.size = 0
+        self.rotation = rotation
+
+    @classmethod
+    def from_particles(cls, particles, extra_capacity=16):
+        """Creates a record from a list of Particle instances."""
+        record = cls(len(particles) + extra_capacity)
+        for particle in particles:
+            record.append(particle.pid, particle.mom, particle.color)
+        return record
+
+    @classmethod
+    def from_arrays(cls, particle_nums, momenta, colors, rotation=None):
+        """Creates a record wrapping the arrays of particle numbers, momenta (shape
+        (n, 4)) and colors (shape (n, 2)) of an event, without copying them."""
+        record = cls(0, rotation)
+        record.pid, record.mom, record.col = particle_nums, momenta, colors
+        record.size = len(particle_nums)
+        return record
+
+    def copy(self, rotation=_SAME_ROTATION):
+        """Copies the record, with the same rotation to the lab frame unless
+        another `rotation` (possibly None, for the lab frame) is given."""
+        record = EventRecord(len(self.pid), self.rotation if rotation is _SAME_ROTATION else rotation)
+        record.pid[:] = self.pid
+        record.mom[:] = self.mom
+        record.col[:] = self.col
+        record.size = self.size
+        return record
+
+    def to_particles(self):
+        """Converts the record into a list of Particle instances, with momenta
+        in the lab frame."""
+        return [Particle(pid, Vec4(*mom), color) for (pid, mom, color)
+                in zip(self.pid[:self.size].tolist(), self.lab_momenta().array.tolist(),
+                       self.col[:self.size].tolist())]
+
+    def update_particles(self, particles):
+        """Writes the record into the list of Particle instances it was created from,
+        modifying them in-place and appending the particles added since."""
+        for (i, particle) in enumerate(self.to_particles()):
+            if i < len(particles):
+                particles[i].set(particle.pid, particle.mom, particle.color)
+            else:
+                particles.append(particle)
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [ParticleView(self, k) for k in range(*i.indices(self.size))]
+        if i < 0:
+            i += self.size
+        if not 0 <= i < self.size:
+            raise IndexError("EventRecord index out of range")
+        return ParticleView(self, i)
+
+    def __iter__(self):
+        return (ParticleView(self, i) for i in range(self.size))
+
+    def __repr__(self):
+        return "\n".join(str(particle) for particle in self)
+
+    def append(self, particle_num, momentum, color=None):
+        """Adds a particle at the end of the record, growing its capacity if needed."""
+        if self.size == len(self.pid):
+            capacity = max(1, 2 * len(self.pid))
+            self.pid = np.resize(self.pid, capacity)
+            self.mom = np.resize(self.mom, (capacity, 4))
+            self.col = np.resize(self.col, (capacity, 2))
+        self.size += 1
+        self.set(self.size - 1, particle_num, momentum, color)
+
+    def set(self, i, particle_num, momentum, color=None):
+        self.pid[i] = particle_num
+        self.set_momentum(i, momentum)
+        self.col[i] = color if color is not None else [0, 0]
+
+    def momentum(self, i):
+        return Vec4(*self.mom[i].tolist())
+
+    def set_momentum(self, i, momentum):
+        """Sets the momentum of the particle `i`, given as a Vec4 or as an array (E, px, py, pz)."""
+        if isinstance(momentum, Vec4):
+            self.mom[i] = (momentum.E, momentum.px, momentum.py, momentum.pz)
+        else:
+            self.mom[i] = momentum
+
+    def color(self, i):
+        return self.col[i].tolist()
 
+    def momenta(self):
+        """Momenta of all the particles in the frame of the record, as a Vec4Array
+        view of the record."""
+        return Vec4Array(self.mom[:self.size])
 
-def check_event(event):
+    def lab_momenta(self):
+        """Momenta of all the particles in the lab frame, as a Vec4Array."""
+        if self.rotation is None:
+            return self.momenta()
+        momenta = np.empty((self.size, 4))
+        momenta[:, 0] = self.mom[:self.size, 0]
+        momenta[:, 1:] = self.mom[:self.size, 1:] @ self.rotation.T
+        return Vec4Array(momenta)
+
+    def rotateToLab(self):
+        """Rotates the momenta of the record to the lab frame, in-place."""
+        if self.rotation is not None:
+            self.mom[:self.size] = self.lab_momenta().array
+            self.rotation = None
+
+
+class ParticleView:
+    """A particle of an EventRecord, with the same interface as Particle. Its
+    momentum is given in the frame of the record.
+
+    The `mom` and `color` of a view are copies read from the record, so that
+    modifying them in-place (e.g. `view.color[0] = 1`) does not change the
+    record: assign them instead (e.g. `view.color = [1, view.color[1]]`)."""
+
+    __slots__ = ("record", "index")
+
+    def __init__(self, record, index):
+        self.record = record
+        self.index = index
+
+    def __repr__(self):
+        return "{0} {1} {2}".format(self.pid, self.mom, self.color)
+
+    def __str__(self):
+        return "{0} {1} {2}".format(self.pid, self.mom, self.color)
+
+    @property
+    def pid(self):
+        return int(self.record.pid[self.index])
+
+    @pid.setter
+    def pid(self, particle_num):
+        self.record.pid[self.index] = particle_num
+
+    @property
+    def mom(self):
+        return self.record.momentum(self.index)
+
+    @mom.setter
+    def mom(self, momentum):
+        self.record.set_momentum(self.index, momentum)
+
+    @property
+    def color(self):
+        return self.record.color(self.index)
+
+    @color.setter
+    def color(self, color):
+        self.record.col[self.index] = color
+
+    def set(self, particle_num, momentum, color=None):
+        self.record.set(self.index, particle_num, momentum, color)
+
+    def is_color_connected(self, other):
+        return colors_connected(self.color, other.color)
+
+
+def check_event(event, num_incoming=2, tolerance=1.e-10):
     """Checks momentum and color conservation in an event (= list of Particle
-    instances)."""
-    p_sum = Vec4()
-    csum = {}
-    for p in event:
-        p_sum += p.mom
-        if p.color[0] > 0: 
-            csum[p.color[0]] = csum.get(p.color[0], 0) + 1
-            if csum[p.color[0]] == 0:
-                del csum[p.color[0]]
-        if p.color[1] > 0:
-            csum[p.color[1]] = csum.get(p.color[1], 0) - 1
-            if csum[p.color[1]] == 0:
-                del csum[p.color[1]]
-    return (m.fabs(p_sum.E) < 1.e-12 and m.fabs(p_sum.px) < 1.e-12 and
-            m.fabs(p_sum.py) < 1.e-12 and m.fabs(p_sum.pz) < 1.e-12 and
-            len(csum) == 0
-            )
+    instances, or EventRecord), whose first `num_incoming` particles are incoming.
+    To check many events at once, use an EventValidator."""
+    from .event_validator import event_arrays, conservation_checks
+
+    _, momentum_ok, color_ok = conservation_checks(*event_arrays([event]), num_incoming=num_incoming,
+                                                   tolerance=tolerance)
+    return bool(momentum_ok[0] and color_ok[0])
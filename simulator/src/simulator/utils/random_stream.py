@@ -0,0 +1,55 @@
+from operator import length_hint
+
+import numpy as np
+
+
+class UniformStream:
+    """
+    Stream of uniform random numbers in [0, 1), drawn from a NumPy generator in
+    blocks of `block_size` and handed out one at a time, which is much cheaper
+    than calling the generator for every single number.
+
+    The numbers are the same as the ones of successive calls to the `random`
+    method of the generator, so the stream is reproducible from its seed. The
+    stream can also be restarted at any `position` (the number of random
+    numbers handed out so far) with `from_position`.
+
+    Example usage:
+
+      rng = UniformStream(seed=42)
+      u = rng.random()
+
+    """
+
+    __slots__ = ("generator", "block_size", "_numbers", "_num_generated")
+
+    def __init__(self, seed=None, block_size=4096):
+        """Initializes the stream from a `seed` (an integer, a SeedSequence, or
+        a NumPy Generator, which is then used directly)."""
+        self.generator = np.random.default_rng(seed=seed)
+        self.block_size = block_size
+        self._numbers = iter(())
+        self._num_generated = 0
+
+    @classmethod
+    def from_position(cls, seed, position, block_size=4096):
+        """Creates the stream of `seed` (an integer or a SeedSequence), starting
+        after its first `position` random numbers."""
+        stream = cls(seed, block_size)
+        # Each random number uses a single step of the (PCG64) bit generator.
+        stream.generator.bit_generator.advance(position)
+        stream._num_generated = position
+        return stream
+
+    def random(self):
+        """Returns the next random number of the stream."""
+        try:
+            return next(self._numbers)
+        except StopIteration:
+            self._numbers = iter(self.generator.random(self.block_size).tolist())
+            self._num_generated += self.block_size
+            return next(self._numbers)
+
+    def position(self):
+        """Number of random numbers handed out so far."""
+        return self._num_generated - length_hint(self._numbers)
@@ -1,12 +1,37 @@
-from numpy import pi, sqrt, log, cos, sin, random
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+from time import perf_counter
 
+import math as m
+
+from numpy import pi
+
+from . import jit_kernels
 from .vector import Vec4
-from .particle import Particle
+from .particle import EventRecord
+from .random_stream import UniformStream
+from .shower_stats import ShowerStats
 from .qcd_group_constants import *
 # from .particle import check_event
 
 
-random = random.default_rng(seed=42)
+def soft_integral(a, b, zm, zp):
+    """Integral of the overestimate a/(1-z)-b over [zm, zp]."""
+    return a*m.log((1.-zm)/(1.-zp))-b*(zp-zm)
+
+
+# Plain-Python version of the (possibly compiled) kernel, for the "python" backend.
+_python_soft_z = getattr(jit_kernels.soft_z, "py_func", jit_kernels.soft_z)
+
+
+def generate_soft_z(a, b, zm, zp, rng, backend="python"):
+    """Generates z in [zm, zp] following the overestimate a/(1-z)-b (positive
+    in [0, 1)), by inverting its integral with Newton's method in the variable
+    w = log((1-zm)/(1-z)), see jit_kernels.soft_z. The compiled kernel is only
+    used with `backend="jit"`."""
+    if backend == "jit":
+        return jit_kernels.soft_z(a, b, zm, zp, rng.random())
+    return _python_soft_z(a, b, zm, zp, rng.random())
 
 
 class Kernel:
@@ -29,15 +54,16 @@ class Pqq(Kernel):
 
     @staticmethod
     def Estimate(z):
-        return CF*2./(1.-z)
+        # Value(z, y) <= CF*(2/(1-z)-(1+z)) for y in [0, 1), and z >= 0.
+        return CF*(2./(1.-z)-1.)
 
     @staticmethod
     def Integral(zm, zp):
-        return CF*2.*log((1.-zm)/(1.-zp))
+        return CF*soft_integral(2., 1., zm, zp)
 
     @staticmethod
-    def GenerateZ(zm, zp):
-        return 1.+(zp-1.)*pow((1.-zm)/(1.-zp), random.random())
+    def GenerateZ(zm, zp, rng, backend="python"):
+        return generate_soft_z(2., 1., zm, zp, rng, backend)
 
 
 class Pgg(Kernel):
@@ -51,15 +77,16 @@ class Pgg(Kernel):
 
     @staticmethod
     def Estimate(z):
-        return CA/(1.-z)
+        # Value(z, y) <= CA*(1/(1-z)-1+z*(1-z)/2) for y in [0, 1), and z*(1-z) <= 1/4.
+        return CA*(1./(1.-z)-7./8.)
 
     @staticmethod
     def Integral(zm, zp):
-        return CA*log((1.-zm)/(1.-zp))
+        return CA*soft_integral(1., 7./8., zm, zp)
 
     @staticmethod
-    def GenerateZ(zm, zp):
-        return 1.+(zp-1.)*pow((1.-zm)/(1.-zp), random.random())
+    def GenerateZ(zm, zp, rng, backend="python"):
+        return generate_soft_z(1., 7./8., zm, zp, rng, backend)
 
 
 class Pgq(Kernel):
@@ -80,28 +107,79 @@ class Pgq(Kernel):
         return TR/2.*(zp-zm)
 
     @staticmethod
-    def GenerateZ(zm, zp):
-        return zm+(zp-zm)*random.random()
+    def GenerateZ(zm, zp, rng, backend="python"):
+        return zm+(zp-zm)*rng.random()
 
 
 class Shower:
     """
     A simple shower cascade simulator.
     """
-    def __init__(self, alphas, t0=1.0):
+    def __init__(self, alphas, t0=1.0, seed=42, alphas_region_ratio=2., alphas_variations=None,
+                 collect_stats=False, backend="python"):
         """Initializes the shower and its splitting kernels, given a AlphaS
-        strong coupling instance `alphas` and a lower cut-off scale `t0`."""
+        strong coupling instance `alphas`, a lower cut-off scale `t0` and the
+        `seed` (an integer or a SeedSequence) of its stream of random numbers.
+
+        The strong coupling is overestimated piecewise, by its value at the
+        lower edge of regions [t0*r**k, t0*r**(k+1)] of the scale, where r is
+        `alphas_region_ratio`.
+
+        For each alternative strong coupling in `alphas_variations` (callables
+        of the scale, e.g. AlphaS instances of another order or value at the Z
+        mass, or `lambda t: alphas(k * t)` for a scaled renormalisation scale),
+        the shower computes the weight of each event relative to `alphas`,
+        from its accepted and rejected trial emissions. The overestimates of
+        the coupling are then the largest of all the couplings, so that the
+        weights stay positive. The weights of the last event are stored in
+        `variation_weights`.
+
+        If `collect_stats` is true, statistics of the veto algorithm and timings
+        are recorded for each event in `stats` (a ShowerStats instance).
+
+        With `backend="jit"` (experimental), the generation of z and the
+        kinematics of the splittings are computed by the kernels of jit_kernels
+        on the arrays of the event record, compiled with Numba. Both backends
+        give the same events for a fixed seed, but the compiled kernels only
+        cover a small part of the time per event, so the shower as a whole is
+        not faster yet (see jit_kernels.benchmark). If Numba is not installed,
+        the shower falls back to the pure-Python path, and `backend` is set to
+        "python"."""
+        self.rng = UniformStream(seed=seed)
         self.t0 = t0
         self.t = None
         self.alphas = alphas
-        self.alphas_max = alphas(self.t0)
+        self.alphas_variations = list(alphas_variations) if alphas_variations is not None else []
+        self.variation_weights = [1.] * len(self.alphas_variations)
+        self.alphas_max = self.alphasEstimate(self.t0)
+        # lower edges of the regions of the scale, and the overestimates of
+        # the strong coupling in each region
+        self.alphas_region_ratio = alphas_region_ratio
+        self.alphas_edges = [self.t0]
+        self.alphas_estimates = [self.alphas_max]
+        # number of trial emissions and of accepted ones
+        self.num_trials = 0
+        self.num_accepted = 0
+        self.stats = ShowerStats() if collect_stats else None
+        if backend not in ["python", "jit"]:
+            exit(f"Shower backend: '{backend}' not implemented.")
+        self.backend = backend if jit_kernels.HAS_NUMBA else "python"
         # set up q->qg splitting kernels
         self.kernels = [Pqq([fl, fl, 21]) for fl in [-5, -4, -3, -2, -1, 1, 2, 3, 4, 5]]
         # set up g->qq splitting kernels
         self.kernels += [Pgq([21, fl, -fl]) for fl in [1, 2, 3, 4, 5]]
         # set up g->gg splitting kernels
         self.kernels += [Pgg([21, 21, 21])]
+        # index the kernels by the particle number of the splitter
+        self.kernels_by_pid = {}
+        for sf in self.kernels:
+            self.kernels_by_pid.setdefault(sf.particle_nums[0], []).append(sf)
         self.current_color_index = None
+        # splittings of each particle of the current event, and the particles
+        # carrying each color and anti-color index
+        self.dipoles = None
+        self.color_owners = None
+        self.anticolor_owners = None
 
     @staticmethod
     def make_kinematics(z, y, phi, p_ij_t, pkt):
@@ -112,16 +190,20 @@ class Shower:
         Returns the momenta in a list in that order.
         """
         Q = p_ij_t + pkt
-        rkt = sqrt(Q.invariant_mass_squared()*y*z*(1.-z))
+        rkt = m.sqrt(Q.invariant_mass_squared()*y*z*(1.-z))
         kt1 = p_ij_t.cross_product(pkt)
         if kt1.length_3d() < 1.e-6:
             kt1 = p_ij_t.cross_product(Vec4(0., 1., 0., 0.))
-        kt1 *= rkt*cos(phi)/kt1.length_3d()
-        kt2cms = Q.boost(p_ij_t).cross_product(kt1)
-        kt2cms *= rkt*sin(phi)/kt2cms.length_3d()
+        kt1 *= rkt*m.cos(phi)/kt1.length_3d()
+        kt2cms = Q.boost_cross_product(p_ij_t, kt1)
+        kt2cms *= rkt*m.sin(phi)/kt2cms.length_3d()
         kt2 = Q.boost_back(kt2cms)
-        p_i = z * p_ij_t + (1. - z) * y * pkt + kt1 + kt2
-        p_j = (1.-z) * p_ij_t + z * y * pkt - kt1 - kt2
+        p_i = (z * p_ij_t).add_scaled((1. - z) * y, pkt)
+        p_i += kt1
+        p_i += kt2
+        p_j = ((1.-z) * p_ij_t).add_scaled(z * y, pkt)
+        p_j -= kt1
+        p_j -= kt2
         p_k = (1.-y)*pkt
         return [p_i, p_j, p_k]
 
@@ -141,7 +223,7 @@ class Shower:
         else:
             if particle_nums[1] == 21:
                 if col_ij[0] == col_k[1]:
-                    if col_ij[1] == col_k[0] and random.random() > 0.5:
+                    if col_ij[1] == col_k[0] and self.rng.random() > 0.5:
                         return [[col_ij[0], self.current_color_index], [self.current_color_index, col_ij[1]]]
                     return [[self.current_color_index, col_ij[1]], [col_ij[0], self.current_color_index]]
                 else:
@@ -152,74 +234,229 @@ class Shower:
                 else:
                     return [[0, col_ij[1]], [col_ij[0], 0]]
 
-    def getSplittingsList(self, event):
+    def initDipoles(self, event):
+        """Sets up the color maps and the splittings of all the final-state
+        particles of the event (= EventRecord)."""
+        self.color_owners = {}
+        self.anticolor_owners = {}
+        for i in range(2, len(event)):
+            self.assignColors(i, event.color(i))
+        self.dipoles = [([], []), ([], [])]
+        self.dipoles += [self.makeDipoles(event, i) for i in range(2, len(event))]
+
+    def assignColors(self, i, color):
+        if color[0] > 0:
+            self.color_owners[color[0]] = i
+        if color[1] > 0:
+            self.anticolor_owners[color[1]] = i
+
+    def removeColors(self, i, color):
+        if self.color_owners.get(color[0]) == i:
+            del self.color_owners[color[0]]
+        if self.anticolor_owners.get(color[1]) == i:
+            del self.anticolor_owners[color[1]]
+
+    def colorPartners(self, i, color):
+        """Indices of the particles color-connected to the particle `i` with
+        the given color, in increasing order."""
+        partners = set()
+        if color[0] > 0 and color[0] in self.anticolor_owners:
+            partners.add(self.anticolor_owners[color[0]])
+        if color[1] > 0 and color[1] in self.color_owners:
+            partners.add(self.color_owners[color[1]])
+        partners.discard(i)
+        return sorted(partners)
+
+    def makeDipoles(self, event, split):
+        """Lists the splittings [splitter index, spectator index, kernel, m2, zp]
+        of the particle `split`, with their integrated overestimates (without
+        the strong coupling)."""
         splittings = []
         g_values = []
 
-        for split in event[2:]:
-            for spect in event[2:]:
-                if spect == split:
-                    continue
-                if not split.is_color_connected(spect):
-                    continue
-                for sf in self.kernels:
-                    if sf.particle_nums[0] != split.pid:
-                        continue
-                    m2 = (split.mom + spect.mom).invariant_mass_squared()
-                    if m2 < 4. * self.t0:
-                        continue
-                    zp = .5 * (1. + sqrt(1. - 4. * self.t0 / m2))
-                    g = self.alphas_max / (2. * pi) * sf.Integral(1. - zp, zp)
-                    splittings.append([split, spect, sf, m2, zp])
-                    g_values.append(g)
+        kernels = self.kernels_by_pid.get(int(event.pid[split]))
+        if kernels is None:
+            return splittings, g_values
+
+        p_split = event.momentum(split)
+        for spect in self.colorPartners(split, event.color(split)):
+            m2 = p_split.pair_mass_squared(event.momentum(spect))
+            if m2 < 4. * self.t0:
+                continue
+            zp = .5 * (1. + m.sqrt(1. - 4. * self.t0 / m2))
+            for sf in kernels:
+                g = sf.Integral(1. - zp, zp) / (2. * pi)
+                splittings.append([split, spect, sf, m2, zp])
+                g_values.append(g)
+
+        return splittings, g_values
+
+    def updateDipoles(self, event, split, spect, split_color):
+        """Updates the color maps and the splittings touched by the last
+        splitting of the particle `split` (previously with color `split_color`),
+        which added the last particle of the event and recoiled on `spect`."""
+        emitted = len(event) - 1
+        touched = {split, spect, emitted}
+        touched.update(self.colorPartners(split, split_color))
+        touched.update(self.colorPartners(spect, event.color(spect)))
+
+        self.removeColors(split, split_color)
+        self.assignColors(split, event.color(split))
+        self.assignColors(emitted, event.color(emitted))
+        for i in (split, spect, emitted):
+            touched.update(self.colorPartners(i, event.color(i)))
+
+        self.dipoles.append(([], []))
+        for i in touched:
+            if i >= 2:
+                self.dipoles[i] = self.makeDipoles(event, i)
+
+    def getSplittingsList(self, event):
+        """Lists the possible splittings [splitter index, spectator index, kernel, m2, zp]
+        of the final-state particles in the event (= EventRecord), with their
+        integrated overestimates (without the strong coupling), from the cached
+        splittings of each particle."""
+        if self.dipoles is None:
+            self.initDipoles(event)
+
+        splittings = [s for (particle_splittings, _) in self.dipoles for s in particle_splittings]
+        g_values = [g for (_, particle_g_values) in self.dipoles for g in particle_g_values]
 
         return splittings, g_values
 
     def generateNextEmission(self, event):
         """Generate the next emission starting from the current scale `self.t`,
-        using the Sudakov veto algorithm. The passed event (= list of Particle instances)
+        using the Sudakov veto algorithm. The passed event (= EventRecord)
         is modified in-place, if a splitting occurs."""
+        stats = self.stats
+        if stats is not None:
+            time_start = perf_counter()
         splittings, g_values = self.getSplittingsList(event)
+        if stats is not None:
+            stats.addSplittingsList(len(splittings), perf_counter() - time_start)
+
+        # The competition between the splittings is sampled at once: the trial
+        # scale follows the sum of the overestimates, and the splitting is picked
+        # with a probability proportional to its overestimate.
+        g_cumulative = list(accumulate(g_values))
+        if not g_cumulative:
+            self.t = self.t0
+            return
+        g_sum = g_cumulative[-1]
 
         while self.t > self.t0:
-            t = self.t0
-            max_id = None
-            for (idx, g) in enumerate(g_values):
-                tt = self.t * pow(random.random(), 1. / g)
-                if tt > t:
-                    t = tt
-                    max_id = idx
+            # overestimate of the strong coupling in the region of the current scale
+            region = bisect_left(self.alphas_edges, self.t) - 1
+            alphas_estimate = self.alphas_estimates[region]
+
+            t = self.t * pow(self.rng.random(), 1. / (alphas_estimate * g_sum))
+            if t <= self.alphas_edges[region]:
+                # no trial emission in this region, continue from its lower edge
+                self.t = self.alphas_edges[region]
+                continue
 
             self.t = t
-            if t > self.t0:
-                s = splittings[max_id]
-                z = s[2].GenerateZ(1. - s[4], s[4])
-                y = t / s[3] / z / (1. - z)
-                if y < 1.:
-                    f = (1. - y) * self.alphas(t) * s[2].Value(z, y)
-                    g = self.alphas_max * s[2].Estimate(z)
-                    if f / g > random.random():
-                        phi = 2. * pi * random.random()
-                        moms = self.make_kinematics(z, y, phi, s[0].mom, s[1].mom)
-                        cols = self.make_colors(s[2].particle_nums, s[0].color, s[1].color)
-                        event.append(Particle(s[2].particle_nums[2], moms[1], cols[1]))
-                        s[0].set(s[2].particle_nums[1], moms[0], cols[0])
-                        s[1].mom = moms[2]
-                        return
+            self.num_trials += 1
+            if stats is not None:
+                stats.current["trials"] += 1
+            idx = bisect_right(g_cumulative, self.rng.random() * g_sum)
+            s = splittings[min(idx, len(splittings) - 1)]
+            z = s[2].GenerateZ(1. - s[4], s[4], self.rng, self.backend)
+            y = t / s[3] / z / (1. - z)
+            if y < 1.:
+                alphas_t = self.alphas(t)
+                f = (1. - y) * alphas_t * s[2].Value(z, y)
+                g = alphas_estimate * s[2].Estimate(z)
+                accepted = f / g > self.rng.random()
+                if self.alphas_variations:
+                    self.reweightTrial(t, alphas_t, f, g, accepted)
+                if not accepted:
+                    if stats is not None:
+                        stats.current["vetoes_f"] += 1
+                    continue
+                self.num_accepted += 1
+                phi = 2. * pi * self.rng.random()
+                if stats is not None:
+                    stats.current["accepted_" + type(s[2]).__name__] += 1
+                    time_start = perf_counter()
+                if self.backend == "jit":
+                    moms = jit_kernels.make_kinematics(z, y, phi, event.mom[s[0]], event.mom[s[1]])
+                else:
+                    moms = self.make_kinematics(z, y, phi, event.momentum(s[0]), event.momentum(s[1]))
+                if stats is not None:
+                    stats.current["time_kinematics"] += perf_counter() - time_start
+                split_color = event.color(s[0])
+                cols = self.make_colors(s[2].particle_nums, split_color, event.color(s[1]))
+                event.append(s[2].particle_nums[2], moms[1], cols[1])
+                event.set(s[0], s[2].particle_nums[1], moms[0], cols[0])
+                event.set_momentum(s[1], moms[2])
+                if stats is not None:
+                    time_start = perf_counter()
+                self.updateDipoles(event, s[0], s[1], split_color)
+                if stats is not None:
+                    stats.current["time_dipoles"] += perf_counter() - time_start
+                return
+            elif stats is not None:
+                stats.current["vetoes_y"] += 1
         return
 
+    def reweightTrial(self, t, alphas_t, f, g, accepted):
+        """Multiplies the weights of the coupling variations by the ratio of the
+        probabilities of accepting (or rejecting) the trial emission at scale `t`,
+        with nominal coupling `alphas_t`, splitting function `f` and overestimate
+        `g`, for the alternative and the nominal couplings."""
+        for (k, alphas) in enumerate(self.alphas_variations):
+            ratio = alphas(t) / alphas_t
+            if accepted:
+                self.variation_weights[k] *= ratio
+            else:
+                self.variation_weights[k] *= (g - ratio * f) / (g - f)
+
+    def extendAlphasRegions(self, t):
+        """Adds regions of the scale with their strong coupling overestimates,
+        until they reach the scale `t`."""
+        while self.alphas_edges[-1] < t:
+            self.alphas_edges.append(self.alphas_edges[-1] * self.alphas_region_ratio)
+            self.alphas_estimates.append(self.alphasEstimate(self.alphas_edges[-1]))
+
+    def alphasEstimate(self, t):
+        """Overestimate of the strong coupling in a region of the scale with
+        lower edge `t`: the largest of the nominal and alternative couplings
+        at `t`, so that the trial emissions are accepted with a probability
+        at most one for each of them."""
+        return max([self.alphas(t)] + [alphas(t) for alphas in self.alphas_variations])
+
+    def acceptanceRate(self):
+        """Fraction of the trial emissions accepted by the veto algorithm, over
+        all the showers run so far."""
+        return self.num_accepted / self.num_trials if self.num_trials > 0 else 0.
+
     def run(self, event, t):
-        """Runs the shower on a given event (= list of Particle instances),
-        starting from the scale `t`. The event is modified in-place to take
-        into account the occurring emissions (if any).
+        """Runs the shower on a given event (= list of Particle instances, or
+        EventRecord), starting from the scale `t`. The event is modified in-place
+        to take into account the occurring emissions (if any).
 
         It is assumed that the first two particles in the event are the
         incoming particles.  Since this is a final-state shower only, they are
         ignored (but assumed to be present in the list).
         """
         self.current_color_index = 1
+        self.variation_weights = [1.] * len(self.alphas_variations)
+        self.extendAlphasRegions(t)
         # generate emissions as long as we are above the cut-off scale `t0`
         self.t = t
 
+        record = event if isinstance(event, EventRecord) else EventRecord.from_particles(event)
+        if self.stats is not None:
+            self.stats.beginEvent()
+            time_start = perf_counter()
+        self.initDipoles(record)
+        if self.stats is not None:
+            self.stats.current["time_dipoles"] += perf_counter() - time_start
         while self.t > self.t0:
-            self.generateNextEmission(event)
+            self.generateNextEmission(record)
+        if self.stats is not None:
+            self.stats.endEvent()
+
+        if record is not event:
+            record.update_particles(event)
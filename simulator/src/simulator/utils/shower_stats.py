@@ -0,0 +1,86 @@
+import json
+
+import numpy as np
+
+
+class ShowerStats:
+    """
+    Statistics of the veto algorithm of a Shower, recorded for each event:
+
+      trials            number of trial emissions,
+      vetoes_y          trials vetoed because y >= 1,
+      vetoes_f          trials vetoed by the ratio of splitting function and overestimate,
+      accepted_Pqq,     accepted emissions of each kernel type,
+      accepted_Pgq,
+      accepted_Pgg
+      splittings_max    largest and mean size of the list of splittings,
+      splittings_mean
+      time_splittings   time (in seconds) spent in getSplittingsList (reading the cached splittings),
+      time_dipoles      time (in seconds) spent building and updating the cached splittings (initDipoles
+                        and updateDipoles),
+      time_kinematics   time (in seconds) spent in make_kinematics.
+
+    Example usage:
+
+      shower = Shower(alphas, collect_stats=True)
+      for event in events:
+          shower.run(event, t=s)
+      print(shower.stats.summary())
+      shower.stats.to_json("shower_stats.json")
+
+    """
+
+    FIELDS = ("trials", "vetoes_y", "vetoes_f", "accepted_Pqq", "accepted_Pgq", "accepted_Pgg",
+              "splittings_max", "splittings_mean", "time_splittings", "time_dipoles", "time_kinematics")
+
+    def __init__(self):
+        self.events = {field: [] for field in self.FIELDS}
+        # counters of the current event
+        self.current = None
+        self.num_splittings_lists = 0
+        self.splittings_sum = 0
+
+    def __len__(self):
+        return len(self.events["trials"])
+
+    def beginEvent(self):
+        self.current = dict.fromkeys(self.FIELDS, 0)
+        self.num_splittings_lists = 0
+        self.splittings_sum = 0
+
+    def endEvent(self):
+        if self.num_splittings_lists > 0:
+            self.current["splittings_mean"] = self.splittings_sum / self.num_splittings_lists
+        for field in self.FIELDS:
+            self.events[field].append(self.current[field])
+
+    def addSplittingsList(self, size, time):
+        self.num_splittings_lists += 1
+        self.splittings_sum += size
+        self.current["splittings_max"] = max(self.current["splittings_max"], size)
+        self.current["time_splittings"] += time
+
+    def to_arrays(self):
+        """Returns the statistics as a dictionary of arrays, with one entry per event."""
+        return {field: np.array(values) for (field, values) in self.events.items()}
+
+    def summary(self):
+        """Returns the statistics summed over all the events (largest and mean list
+        of splittings over all the events), and the acceptance rate of the trials."""
+        arrays = self.to_arrays()
+        summary = {field: float(np.sum(values)) for (field, values) in arrays.items()}
+        summary["splittings_max"] = float(np.max(arrays["splittings_max"], initial=0))
+        summary["splittings_mean"] = float(np.mean(arrays["splittings_mean"])) if len(self) > 0 else 0.
+        accepted = summary["accepted_Pqq"] + summary["accepted_Pgq"] + summary["accepted_Pgg"]
+        summary["acceptance_rate"] = accepted / summary["trials"] if summary["trials"] > 0 else 0.
+        summary["num_events"] = len(self)
+        return summary
+
+    def to_json(self, file_name=None):
+        """Returns the summary and the statistics of each event as a JSON string,
+        and writes it to the file `file_name` if given."""
+        text = json.dumps({"summary": self.summary(), "events": self.events})
+        if file_name is not None:
+            with open(file_name, "w") as file:
+                file.write(text)
+        return text
@@ -2,6 +2,11 @@ import math as m
 
 
 class Vec4:
+    """A four-momentum (E, px, py, pz). The in-place operators and the fused helpers
+    (`dot`, `pair_mass_squared`, `add_scaled`, `boost_cross_product`) avoid creating
+    temporary Vec4 instances in the hot loops of the shower and the analysis."""
+
+    __slots__ = ("E", "px", "py", "pz")
 
     def __init__(self, E=0., px=0., py=0., pz=0.):
         self.E = E
@@ -35,6 +40,30 @@ class Vec4:
     def __neg__(self):
         return Vec4(-self.E, -self.px, -self.py, -self.pz)
 
+    def __iadd__(self, v):
+        self.E += v.E
+        self.px += v.px
+        self.py += v.py
+        self.pz += v.pz
+        return self
+
+    def __isub__(self, v):
+        self.E -= v.E
+        self.px -= v.px
+        self.py -= v.py
+        self.pz -= v.pz
+        return self
+
+    def __imul__(self, v):
+        # As for `*`, the product with a four-momentum is the Minkowski product (a number).
+        if isinstance(v, Vec4):
+            return self * v
+        self.E *= v
+        self.px *= v
+        self.py *= v
+        self.pz *= v
+        return self
+
     def __mul__(self, v):
         if isinstance(v, Vec4):
             return self.E * v.E - self.px * v.px - self.py * v.py - self.pz * v.pz
@@ -45,11 +74,37 @@ class Vec4:
             return self.E * v.E - self.px * v.px - self.py * v.py - self.pz * v.pz
         return Vec4(self.E * v, self.px * v, self.py * v, self.pz * v)
 
-    def __div__(self, v):
+    def __truediv__(self, v):
         return Vec4(self.E / v, self.px / v, self.py / v, self.pz / v)
 
+    __div__ = __truediv__
+
+    def __itruediv__(self, v):
+        self.E /= v
+        self.px /= v
+        self.py /= v
+        self.pz /= v
+        return self
+
+    def dot(self, v):
+        """Minkowski product with the four-momentum `v`."""
+        return self.E * v.E - self.px * v.px - self.py * v.py - self.pz * v.pz
+
+    def pair_mass_squared(self, v):
+        """Invariant mass squared of the sum with the four-momentum `v`, without forming the sum."""
+        E, px, py, pz = self.E + v.E, self.px + v.px, self.py + v.py, self.pz + v.pz
+        return E * E - px * px - py * py - pz * pz
+
+    def add_scaled(self, factor, v):
+        """Adds `factor` times the four-momentum `v` in-place."""
+        self.E += factor * v.E
+        self.px += factor * v.px
+        self.py += factor * v.py
+        self.pz += factor * v.pz
+        return self
+
     def invariant_mass_squared(self):
-        return self * self
+        return self.E * self.E - self.px * self.px - self.py * self.py - self.pz * self.pz
 
     def invariant_mass(self):
         return m.sqrt(self.invariant_mass_squared())
@@ -87,6 +142,18 @@ class Vec4:
                     v.py - c1 * self.py,
                     v.pz - c1 * self.pz)
 
+    def boost_cross_product(self, v, w):
+        """Cross product of `v` boosted to the rest frame of this four-momentum (see `boost`)
+        with `w`, without forming the boosted four-momentum."""
+        rsq = self.invariant_mass()
+        v0 = (self.E * v.E - self.px * v.px - self.py * v.py - self.pz * v.pz) / rsq
+        c1 = (v.E + v0) / (rsq + self.E)
+        bx, by, bz = v.px - c1 * self.px, v.py - c1 * self.py, v.pz - c1 * self.pz
+        return Vec4(0.0,
+                    by * w.pz - bz * w.py,
+                    bz * w.px - bx * w.pz,
+                    bx * w.py - by * w.px)
+
     def boost_back(self, v):
         rsq = self.invariant_mass()
         v0 = (self.E * v.E + self.px * v.px + self.py * v.py + self.pz * v.pz) / rsq
@@ -0,0 +1,172 @@
+import numpy as np
+
+from .vector import Vec4
+
+
+class Vec4Array:
+    """An array of four-momenta (E, px, py, pz), backed by a NumPy array of shape (..., 4).
+
+    The operations mirror those of Vec4, evaluated for all four-momenta at once with the
+    same arithmetic, so that their results agree with the ones of Vec4. Operations between
+    two arrays (or an array and a single Vec4) follow the NumPy broadcasting rules.
+
+    Example usage, computing the invariant masses of pairs of four-momenta:
+
+      p = Vec4Array.from_vec4s([Vec4(1., 0., 0., 1.), Vec4(1., 0., 1., 0.)])
+      q = Vec4Array.from_vec4s([Vec4(1., 0., 0., -1.), Vec4(1., 0., -1., 0.)])
+      print((p + q).invariant_mass_squared())
+
+    """
+
+    __slots__ = ("array",)
+    __array_ufunc__ = None  # Let NumPy arrays defer to the operators of Vec4Array.
+
+    def __init__(self, momenta):
+        """Wraps the array `momenta` of shape (..., 4), without copying it if it is
+        already a float array."""
+        self.array = np.asarray(momenta, dtype=float)
+        if self.array.shape[-1:] != (4,):
+            raise ValueError('Vec4Array requires an array of shape (..., 4), got {0}'.format(self.array.shape))
+
+    @classmethod
+    def from_vec4s(cls, vectors):
+        """Creates an array from a list of Vec4 instances."""
+        return cls(np.array([[v.E, v.px, v.py, v.pz] for v in vectors], dtype=float).reshape(-1, 4))
+
+    def to_vec4s(self):
+        """Converts a one-dimensional array into a list of Vec4 instances."""
+        return [Vec4(*p) for p in self.array.reshape(-1, 4).tolist()]
+
+    @property
+    def E(self):
+        return self.array[..., 0]
+
+    @property
+    def px(self):
+        return self.array[..., 1]
+
+    @property
+    def py(self):
+        return self.array[..., 2]
+
+    @property
+    def pz(self):
+        return self.array[..., 3]
+
+    @property
+    def shape(self):
+        return self.array.shape[:-1]
+
+    def __len__(self):
+        return len(self.array)
+
+    def __getitem__(self, i):
+        momenta = self.array[i]
+        if momenta.ndim == 1:
+            return Vec4(*momenta.tolist())
+        return Vec4Array(momenta)
+
+    def __setitem__(self, i, v):
+        self.array[i] = _components(v)
+
+    def __repr__(self):
+        return 'Vec4Array({0})'.format(self.array.tolist())
+
+    def __str__(self):
+        return str(self.array)
+
+    def __add__(self, v):
+        return Vec4Array(self.array + _components(v))
+
+    __radd__ = __add__
+
+    def __sub__(self, v):
+        return Vec4Array(self.array - _components(v))
+
+    def __neg__(self):
+        return Vec4Array(-self.array)
+
+    def __mul__(self, v):
+        if isinstance(v, (Vec4, Vec4Array)):
+            return self.dot(v)
+        return Vec4Array(self.array * _scalars(v))
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, v):
+        return Vec4Array(self.array / _scalars(v))
+
+    def dot(self, v):
+        """Minkowski products with the four-momenta `v`."""
+        v = _components(v)
+        return self.E * v[..., 0] - self.px * v[..., 1] - self.py * v[..., 2] - self.pz * v[..., 3]
+
+    def invariant_mass_squared(self):
+        return self.E * self.E - self.px * self.px - self.py * self.py - self.pz * self.pz
+
+    def invariant_mass(self):
+        return np.sqrt(self.invariant_mass_squared())
+
+    def length_3d_squared(self):
+        return self.px * self.px + self.py * self.py + self.pz * self.pz
+
+    def length_3d(self):
+        return np.sqrt(self.length_3d_squared())
+
+    def transverse_momentum_squared(self):
+        return self.px * self.px + self.py * self.py
+
+    def transverse_momentum(self):
+        return np.sqrt(self.transverse_momentum_squared())
+
+    def cross_product(self, v):
+        v = _components(v)
+        result = np.zeros(np.broadcast_shapes(self.array.shape, v.shape))
+        result[..., 1] = self.py * v[..., 3] - self.pz * v[..., 2]
+        result[..., 2] = self.pz * v[..., 1] - self.px * v[..., 3]
+        result[..., 3] = self.px * v[..., 2] - self.py * v[..., 1]
+        return Vec4Array(result)
+
+    def boost(self, v):
+        """Boosts the four-momenta `v` to the rest frames of these four-momenta."""
+        return self._boost(v, sign=1.)
+
+    def boost_back(self, v):
+        """Boosts the four-momenta `v` back from the rest frames of these four-momenta."""
+        return self._boost(v, sign=-1.)
+
+    def _boost(self, v, sign):
+        v = _components(v)
+        rsq = self.invariant_mass()
+        if sign > 0:
+            v0 = (self.E * v[..., 0] - self.px * v[..., 1] - self.py * v[..., 2] - self.pz * v[..., 3]) / rsq
+        else:
+            v0 = (self.E * v[..., 0] + self.px * v[..., 1] + self.py * v[..., 2] + self.pz * v[..., 3]) / rsq
+        c1 = (v[..., 0] + v0) / (rsq + self.E)
+        result = np.empty(np.broadcast_shapes(self.array.shape, v.shape))
+        result[..., 0] = v0
+        result[..., 1] = v[..., 1] - sign * c1 * self.px
+        result[..., 2] = v[..., 2] - sign * c1 * self.py
+        result[..., 3] = v[..., 3] - sign * c1 * self.pz
+        return Vec4Array(result)
+
+    def sum(self, axis=0):
+        """Sums the four-momenta along `axis`. Returns a Vec4 if a single four-momentum is left."""
+        total = np.sum(self.array, axis=axis if axis >= 0 else axis - 1)
+        if total.ndim == 1:
+            return Vec4(*total.tolist())
+        return Vec4Array(total)
+
+
+def _components(v):
+    """Array of components of a Vec4, Vec4Array or array of shape (..., 4)."""
+    if isinstance(v, Vec4Array):
+        return v.array
+    if isinstance(v, Vec4):
+        return np.array([v.E, v.px, v.py, v.pz])
+    return np.asarray(v, dtype=float)
+
+
+def _scalars(v):
+    """Scalars (or array of scalars) multiplying each four-momentum."""
+    return np.asarray(v, dtype=float)[..., None]